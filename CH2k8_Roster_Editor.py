@@ -1,29 +1,89 @@
+import argparse
 import sys
-import struct
-import os
-from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QTableWidget,
-                             QTableWidgetItem, QMenuBar, QMenu, QAction,
-                             QFileDialog, QMessageBox, QLabel, QUndoStack, QUndoCommand)
-from PyQt5.QtCore import Qt
-import chardet
+from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QMenuBar, QMenu, QAction,
+                             QFileDialog, QMessageBox, QLabel, QLineEdit, QProgressDialog, QTabWidget, QUndoStack)
+from PyQt5.QtCore import Qt, QThread, QTimer
 import csv
-from ui_functions import CustomTableWidget, MultiEditCommand
+import profiling
+from conferences import CONFERENCE_VALUE_MAXIMUMS
+from roster_session import RosterSession, read_team_edits
+from string_search import SearchIndex
+from ui_functions import CustomTableView, RosterTableModel, RosterWorker, SearchFilterProxyModel, bounded_int
+
+TEAM_HEADERS = ["Team Name", "Abbreviation", "Team Name 2", "Nickname", "Mascot Name"]
+CONFERENCE_HEADERS = ["Conference", "Abbreviation", "Type", "Sort Order", "Founded", "Champs Order", "Final Fours",
+                      "Prev Yr Bids", "Rank", "Last Champ Order", "Presentation ID", "Tourney Slots", "Tourney Day",
+                      "Red", "Green", "Blue"]
+# Name and abbreviation are strings, the rest are unsigned numbers of the width in the layout
+CONFERENCE_TYPES = [str, str] + [bounded_int(maximum) for maximum in CONFERENCE_VALUE_MAXIMUMS]
+# Oldest undo steps are dropped past this many commands
+UNDO_LIMIT = 200
+
+
+# Worker tasks run off the GUI thread and only touch the session they are given
+def load_roster(report, file_path):
+    with profiling.span("editor.load"):
+        session = RosterSession(file_path)
+        if not report(1, 2):
+            session.close()
+            return None
+        return session, session.read_teams(), session.read_conferences()
+
+
+def save_roster(report, session, values, file_path, atomic, compact):
+    # Returns whether the roster was saved and the compaction, if any
+    with profiling.span("editor.save"):
+        applied = session.apply_edits(values, report)
+        if len(applied) < len(values) or not report(len(values), len(values)):
+            return False, None
+        compaction = session.compact_strings() if compact else None
+        session.save(file_path, atomic=atomic)
+        return True, compaction
+
+
+def run_editor(app):
+    roster_editor = RosterEditor()
+    roster_editor.show()
+    return app.exec_()
 
 class RosterEditor(QWidget):
-    def __init__(self):
+    def __init__(self, undo_limit=UNDO_LIMIT):
         super().__init__()
-        self.table = CustomTableWidget()
+        self.model = RosterTableModel(TEAM_HEADERS, self)
+        self.proxy = SearchFilterProxyModel("teams", self)
+        self.proxy.setSourceModel(self.model)
+        self.table = CustomTableView()
+        self.table.setModel(self.proxy)
+        self.conference_model = RosterTableModel(CONFERENCE_HEADERS, self, CONFERENCE_TYPES)
+        self.conference_proxy = SearchFilterProxyModel("conferences", self)
+        self.conference_proxy.setSourceModel(self.conference_model)
+        self.conference_table = CustomTableView()
+        self.conference_table.setModel(self.conference_proxy)
+        self.models = {"teams": self.model, "conferences": self.conference_model}
+        self.proxies = {"teams": self.proxy, "conferences": self.conference_proxy}
+        # Text cells of both tables, kept current as cells change
+        self.search_index = SearchIndex()
+        for table, model in self.models.items():
+            model.dataChanged.connect(lambda top_left, bottom_right, roles=None, table=table:
+                                      self.index_cells(table, top_left.row(), bottom_right.row()))
         self.initUI()
         self.roster_file_path = None
+        self.session = None
         self.team_data = []
+        self.worker = None
+        self.worker_thread = None
+        self.progress_dialog = None
+        self.saving_values = None
+        self.profile_start = None
+        self.close_pending = False
         self.undo_stack = QUndoStack(self)
-        self.table.itemChanged.connect(self.cell_changed)
-        self.ignore_change = False
+        self.undo_stack.setUndoLimit(undo_limit)
+        for model in self.models.values():
+            model.undo_stack = self.undo_stack
 
     def initUI(self):
         self.setGeometry(100, 100, 1200, 1000)
         self.setWindowTitle("College Hoops 2k8 Roster Editor")
-        self.table.itemSelectionChanged.connect(self.commit_ongoing_command)
 
         vbox = QVBoxLayout()
 
@@ -43,6 +103,16 @@ class RosterEditor(QWidget):
         save_action.triggered.connect(self.save_roster_file)
         file_menu.addAction(save_action)
 
+        # Safe saves write a temporary copy and rename it over the roster
+        self.safe_save_action = QAction("Safe Save", self)
+        self.safe_save_action.setCheckable(True)
+        file_menu.addAction(self.safe_save_action)
+
+        # Packs the strings the editor has added and drops orphaned ones before saving
+        self.compact_action = QAction("Compact Strings on Save", self)
+        self.compact_action.setCheckable(True)
+        file_menu.addAction(self.compact_action)
+
         close_action = QAction("Close", self)
         close_action.setShortcut("Ctrl+W")
         close_action.triggered.connect(self.close_roster_file)
@@ -53,12 +123,27 @@ class RosterEditor(QWidget):
         # Create a label to display the file name
         self.file_label = QLabel()
         vbox.addWidget(self.file_label)
-        vbox.addWidget(self.table)
+        # Rows are filtered as the query is typed
+        self.search_bar = QLineEdit()
+        self.search_bar.setPlaceholderText("Search teams and conferences")
+        self.search_bar.setClearButtonEnabled(True)
+        self.search_bar.textChanged.connect(self.search)
+        vbox.addWidget(self.search_bar)
+        self.tabs = QTabWidget()
+        self.tabs.addTab(self.table, "Teams")
+        self.tabs.addTab(self.conference_table, "Conferences")
+        vbox.addWidget(self.tabs)
+        # With --profile the last load or save is broken down here
+        self.profile_label = QLabel()
+        self.profile_label.setWordWrap(True)
+        self.profile_label.setVisible(profiling.enabled)
+        vbox.addWidget(self.profile_label)
 
         # Create the context menu for the table
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.setSortingEnabled(True)
         self.table.setColumnHidden(1, True)
+        self.conference_table.setSortingEnabled(True)
 
         # Edit menu
         edit_menu = QMenu("Edit", self)
@@ -91,6 +176,13 @@ class RosterEditor(QWidget):
         paste_action.triggered.connect(self.paste)
         edit_menu.addAction(paste_action)
 
+        edit_menu.addSeparator()
+
+        find_action = QAction("Find", self)
+        find_action.setShortcut("Ctrl+F")
+        find_action.triggered.connect(self.search_bar.setFocus)
+        edit_menu.addAction(find_action)
+
         self.undo_stack = QUndoStack(self)
 
         file_menu.addSeparator()  # Add this line to insert a separator
@@ -109,14 +201,23 @@ class RosterEditor(QWidget):
         file, _ = QFileDialog.getOpenFileName(self, "Open Roster File", "", "All Files (*)", options=options)
 
         if file:
-            self.roster_file_path = file
-            self.team_data = self.read_roster_file(self.roster_file_path)
-            self.display_team_data(self.team_data)
-            self.file_label.setText(self.roster_file_path)
+            self.run_worker("Opening roster...", self.roster_loaded, load_roster, file)
+
+    def roster_loaded(self, result):
+        if result is None:
+            return
+        session, self.team_data, conference_data = result
+        self.release_roster()
+        self.session = session
+        self.roster_file_path = session.path
+        self.display_team_data(self.team_data)
+        self.conference_model.load(conference_data)
+        self.build_search_index()
+        self.file_label.setText(self.roster_file_path)
 
     def save_roster_file(self):
         if self.roster_file_path:
-            self.write_roster_file(self.roster_file_path, self.team_data)
+            self.write_roster_file(self.roster_file_path)
         else:
             self.save_roster_file_as()
 
@@ -126,47 +227,68 @@ class RosterEditor(QWidget):
         file, _ = QFileDialog.getSaveFileName(self, "Save Roster File As", "", "All Files (*)", options=options)
 
         if file:
-            self.roster_file_path = file
-            self.write_roster_file(self.roster_file_path)
+            self.write_roster_file(file)
 
     def close_roster_file(self):
+        # The worker is still using the session
+        if self.worker is not None:
+            return
         if self.roster_file_path:
-            if any(self.is_item_changed(QTableWidgetItem(team_data[col]), self.table.item(row, col)) for row, team_data in enumerate(self.team_data) for col in range(5)):
+            if any(model.is_dirty() for model in self.models.values()) or self.session is not None and self.session.is_dirty:
                 reply = QMessageBox.question(self, "Close Roster File", "There are unsaved changes. Are you sure you want to close the roster file?", QMessageBox.Yes | QMessageBox.No)
                 if reply == QMessageBox.Yes:
+                    self.release_roster()
                     self.roster_file_path = None
-                    self.table.clear()
-                    self.table.setRowCount(0)
-                    self.table.setColumnCount(0)
+                    self.clear_models()
                     self.file_label.setText("")
             else:
+                self.release_roster()
                 self.roster_file_path = None
-                self.table.clear()
-                self.table.setRowCount(0)
-                self.table.setColumnCount(0)
+                self.clear_models()
                 self.file_label.setText("")
 
+    def clear_models(self):
+        for model in self.models.values():
+            model.clear()
+        self.undo_stack.clear()
+        self.build_search_index()
+
+    def build_search_index(self):
+        self.search_index = SearchIndex()
+        for table, model in self.models.items():
+            self.index_cells(table, 0, model.rowCount() - 1)
+        self.search(self.search_bar.text())
+
+    def index_cells(self, table, first_row, last_row):
+        # Edits only re-index the rows they touched; unchanged cells are skipped
+        model = self.models[table]
+        columns = [col for col in range(model.columnCount()) if model.types[col] is str]
+        for row in range(first_row, last_row + 1):
+            for col in columns:
+                self.search_index.update((table, row, col), model.value(row, col))
+        self.proxies[table].refresh()
+
+    def search(self, query):
+        for proxy in self.proxies.values():
+            proxy.set_search(self.search_index, query)
+
     def cut(self):
-        self.table.cut()
+        self.tabs.currentWidget().cut()
 
     def copy(self):
-        self.table.copy()
+        self.tabs.currentWidget().copy()
 
     def paste(self):
-        self.table.paste()
+        self.tabs.currentWidget().paste()
 
     def delete(self):
-        self.table.delete()
+        self.tabs.currentWidget().delete()
 
     def undo(self):
-        self.ignore_change = True
         self.undo_stack.undo()
-        self.ignore_change = False
 
     def redo(self):
-        self.ignore_change = True
         self.undo_stack.redo()
-        self.ignore_change = False
 
     # Override mousePressEvent and keyPressEvent to handle right-clicks and hotkeys
     def mousePressEvent(self, event):
@@ -198,25 +320,20 @@ class RosterEditor(QWidget):
         else:
             super().keyPressEvent(event)
 
-    def create_multi_edit_command(self, table, changes):
-        return MultiEditCommand(table, changes)
-
     def import_data(self):
+        # Rows are matched against the open roster's teams
+        if self.session is None:
+            QMessageBox.information(self, "Import Data", "Open a roster file before importing data.")
+            return
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getOpenFileName(self, "Import Data", "", "CSV Files (*.csv);;All Files (*)", options=options)
-        if file_name:
+        if file_name and self.session is not None:
+            # Rows are matched to teams as they are read and only differing cells become one undo step
             with open(file_name, newline='', encoding='utf-8') as csvfile:
-                reader = csv.reader(csvfile)
-                self.table.setRowCount(0)
-                self.ignore_change = True
-                for row_data in reader:
-                    row = self.table.rowCount()
-                    self.table.insertRow(row)
-                    for column, data in enumerate(row_data):
-                        item = QTableWidgetItem(data)
-                        item.setData(Qt.UserRole, data)
-                        self.table.setItem(row, column, item)
-                self.ignore_change = False
+                try:
+                    self.model.edit_rows(read_team_edits(csvfile, self.session.team_offsets))
+                except ValueError as e:
+                    QMessageBox.warning(self, "Import Data", f"Could not import {file_name}: {e}")
 
     def export_data(self):
         options = QFileDialog.Options()
@@ -224,88 +341,18 @@ class RosterEditor(QWidget):
         if file_name:
             with open(file_name, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
-                for row in range(self.table.rowCount()):
-                    row_data = []
-                    for column in range(self.table.columnCount()):
-                        item = self.table.item(row, column)
-                        if item is not None:
-                            row_data.append(item.text())
-                        else:
-                            row_data.append('')
-                    writer.writerow(row_data)
-
-    def cell_changed(self, item):
-        if self.ignore_change:
-            return
-
-        old_value = item.data(Qt.UserRole)
-        new_value = item.text()
-        if old_value is None or old_value == new_value:
-            return
+                # Teams are written in file order so the export imports back row for row
+                for row in range(self.model.rowCount()):
+                    writer.writerow([self.model.value(row, column) for column in range(self.model.columnCount())])
 
-        self.ignore_change = True
-        command = self.create_multi_edit_command(self.table, [(item.row(), item.column(), old_value, new_value)])
-        self.undo_stack.push(command)
-        self.ignore_change = False
-        item.setData(Qt.UserRole, new_value)    
-
-    def commit_ongoing_command(self, item=None):
-        if item is not None:
-            self.cell_changed(item)
-
-        if hasattr(self, 'ongoing_command') and self.ongoing_command is not None and self.ongoing_command.changes:
-            self.undo_stack.push(self.ongoing_command)
-            self.ongoing_command = None
-
-    def read_roster_file(self, file_path):
-        with open(file_path, "rb") as file:
-            data = file.read()
-
-        file_length = struct.unpack(">I", data[0:4])[0]
-        team_info_start = 0x1D8614
-        team_info_end = 0x224860
-        team_info_length = 0x2C0
-
-        team_count = (team_info_end - team_info_start) // team_info_length
-        team_data = []
-
-        for i in range(team_count):
-            team_offset = team_info_start + (i * team_info_length)
-            team_name_ptr = team_offset + struct.unpack(">I", data[team_offset:team_offset+4])[0]
-            team_abbr_ptr = team_offset + struct.unpack(">I", data[team_offset+4:team_offset+8])[0] + 4
-            team_name2_ptr = team_offset + struct.unpack(">I", data[team_offset+8:team_offset+12])[0] + 8
-            team_nickname_ptr = team_offset + struct.unpack(">I", data[team_offset+12:team_offset+16])[0] + 12
-            team_mascot_ptr = team_offset + struct.unpack(">I", data[team_offset+16:team_offset+20])[0] + 16
-            
-            team_name = self.read_string(data, team_name_ptr)
-            team_abbr = self.read_string(data, team_abbr_ptr)
-            team_name2 = self.read_string(data, team_name2_ptr)
-            team_nickname = self.read_string(data, team_nickname_ptr)
-            team_mascot = self.read_string(data, team_mascot_ptr)
-
-            team_data.append((team_name, team_abbr, team_name2, team_nickname, team_mascot))
-
-        return team_data
-
-    def read_string(self, data, pointer):
-        string = b""
-        while data[pointer:pointer+2] != b'\x00\x00':
-            string += data[pointer:pointer+2]
-            pointer += 2
-        string += b'\x00\x00'
-        return string.decode("utf-16-le", errors="surrogatepass").rstrip('\x00')
+    def release_roster(self):
+        if self.session is not None:
+            self.session.close()
+        self.session = None
 
     def display_team_data(self, team_data):
-        self.table.setColumnCount(5)
-        self.table.setRowCount(len(team_data))
-        self.table.setHorizontalHeaderLabels(["Team Name", "Abbreviation", "Team Name 2", "Nickname", "Mascot Name"])
-        self.ignore_change = True
-        for i, (team_name, team_abbr, team_name2, team_nickname, team_mascot) in enumerate(team_data):
-            for column, value in enumerate((team_name, team_abbr, team_name2, team_nickname, team_mascot)):
-                item = QTableWidgetItem(value)
-                item.setData(Qt.UserRole, value)
-                self.table.setItem(i, column, item)
-        self.ignore_change = False
+        self.model.load(team_data)
+        self.undo_stack.clear()
 
         # Set the column widths
         self.table.setColumnWidth(0, 170)
@@ -314,128 +361,101 @@ class RosterEditor(QWidget):
         self.table.setColumnWidth(3, 170)
         self.table.setColumnWidth(4, 170)
 
-    def is_item_changed(self, original_item, edited_item):
-        return original_item.text() != edited_item.text()
-
-    # Add this new function to the RosterEditor class
-    def is_string_used_elsewhere(self, data, team_info_start, team_info_end, team_info_length, old_string_pointer, i, j):
-        for search_offset in range(team_info_start, team_info_end, team_info_length):
-            for search_col in range(5):
-                if search_col == j:
-                    continue
-                pointer = struct.unpack(">I", data[search_offset + search_col * 4:search_offset + (search_col + 1) * 4])[0]
-                if old_string_pointer == (search_offset + pointer):
-                    return True
-
-        # Search the table in the editor for a duplicate string
-        for row in range(self.table.rowCount()):
-            for col in range(5):
-                if row == i and col == j:
-                    continue
-                cell_text = self.table.item(row, col).text()
-                if cell_text == self.table.item(i, j).text():
-                    return True
-
-        return False
-
-    def find_string_in_pool(self, data, string_pool_start, string_to_find):
-        pointer = string_pool_start
-        while pointer < len(data):
-            current_string = self.read_string(data, pointer)
-            if current_string.encode("utf-16-le") + b'\x00\x00' == string_to_find:
-                return pointer
-            pointer += (len(current_string) + 1) * 2
-        return -1
-
-    def write_roster_file(self, file_path, team_data):
-        with open(file_path, "rb") as file:
-            data = bytearray(file.read())
-
-        team_info_start = 0x1D8614
-        team_info_length = 0x2C0
-        data_offset = 0x3CBFE0
-        string_pool_start = 0x362CF8
-
-        team_count = len(team_data)
-        team_info_end = team_info_start + team_count * team_info_length
-
-        # Find a space with at least 10 null bytes after data_offset
-        consecutive_null_bytes = 0
-        while consecutive_null_bytes < 10:
-            if data[data_offset:data_offset + 2] == b'\x00\x00':
-                consecutive_null_bytes += 2
+    def write_roster_file(self, file_path):
+        if self.session is None:
+            return
+
+        # The worker gets a snapshot of the dirty cells and never touches the model
+        self.saving_values = [(table, i, j, model.value(i, j))
+                              for table, model in self.models.items() for i, j in model.dirty_cells()]
+        self.run_worker("Saving roster...", self.roster_saved, save_roster,
+                        self.session, self.saving_values, file_path, self.safe_save_action.isChecked(),
+                        self.compact_action.isChecked())
+
+    def roster_saved(self, result):
+        saved, compaction = result
+        self.mark_applied()
+        if saved and self.session is not None:
+            self.roster_file_path = self.session.path
+            if compaction is None:
+                self.file_label.setText(self.roster_file_path)
             else:
-                consecutive_null_bytes = 0
-            data_offset += 2
-
-        # Move back to the start of the 10 null bytes sequence
-        data_offset -= 10
-
-        # Add 2 null bytes as a separator if there is data at data_offset
-        if data_offset > 0x3CBFE0:
-            data_offset += 2
-
-        for i, (team_name, team_abbr, team_name2, team_nickname, team_mascot) in enumerate(team_data):
-            team_offset = team_info_start + (i * team_info_length)
-
-            items_changed = [self.is_item_changed(QTableWidgetItem(name), self.table.item(i, j)) for j, name in enumerate((team_name, team_abbr, team_name2, team_nickname, team_mascot))]
-
-            if any(items_changed):
-                pointers = [struct.unpack(">I", data[team_offset + j * 4:team_offset + (j + 1) * 4])[0] for j in range(5)]
-
-                for j, changed in enumerate(items_changed):
-                    if changed:
-                        new_string = self.table.item(i, j).text().encode("utf-16-le") + b'\x00\x00'
-                        old_string_pointer = team_offset + pointers[j]
-                        old_string = self.read_string(data, old_string_pointer).encode("utf-16-le") + b'\x00\x00'
-
-                        # Check if the new string already exists
-                        new_string_pointer = self.find_string_in_pool(data, string_pool_start, new_string)
-                        if new_string_pointer != -1:
-                            pointer_difference = new_string_pointer - (team_offset + j * 4)
-                            struct.pack_into(">I", data, team_offset + j * 4, pointer_difference)
-                        else:
-                            pointer_difference = old_string_pointer - (team_offset + j * 4)
-
-                            # Check if the original string is used elsewhere in the team info section
-                            is_original_string_used_elsewhere = False
-                            for search_offset in range(team_info_start, team_info_end, 4):
-                                if search_offset != team_offset + j * 4:
-                                    found_pointer_difference = struct.unpack(">I", data[search_offset:search_offset + 4])[0]
-                                    if found_pointer_difference == pointer_difference:
-                                        is_original_string_used_elsewhere = True
-                                        break
-
-                            if len(new_string) == len(old_string) and not self.is_string_used_elsewhere(data, team_info_start, team_info_end, team_info_length, old_string_pointer, i, j):
-                                data[old_string_pointer:old_string_pointer + len(new_string)] = new_string
-                            else:
-                                data[data_offset:data_offset + len(new_string)] = new_string
-                                pointer_difference = data_offset - (team_offset + j * 4)
-                                struct.pack_into(">I", data, team_offset + j * 4, pointer_difference)
-                                data_offset += len(new_string)
-
-                                # Find the next empty space after data_offset
-                                consecutive_null_bytes = 0
-                                while consecutive_null_bytes < 10:
-                                    if data[data_offset:data_offset + 2] == b'\x00\x00':
-                                        consecutive_null_bytes += 2
-                                    else:
-                                        consecutive_null_bytes = 0
-                                    data_offset += 2
-
-                                data_offset -= 10
-                                if data_offset > 0x3CBFE0:
-                                    data_offset += 2
-
-        with open(file_path, "wb") as file:
-            file.write(data)
+                self.file_label.setText(f"{self.roster_file_path} ({compaction.reclaimed} bytes reclaimed)")
+
+    def mark_applied(self):
+        # Edits the worker got to are in the session even if the save was cancelled or failed
+        if self.saving_values is None or self.session is None:
+            self.saving_values = None
+            return
+        for table, model in self.models.items():
+            model.mark_clean([(i, j, value) for edited_table, i, j, value in self.saving_values
+                              if edited_table == table and self.session.read_field(table, i, j) == value])
+        self.saving_values = None
+
+    def run_worker(self, label, on_finished, task, *args):
+        if self.worker is not None:
+            return
+        if profiling.enabled:
+            self.profile_start = profiling.snapshot()
+        self.worker_thread = QThread(self)
+        self.worker = RosterWorker(task, *args)
+        self.worker.moveToThread(self.worker_thread)
+        self.progress_dialog = QProgressDialog(label, "Cancel", 0, 0, self)
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setMinimumDuration(500)
+        self.progress_dialog.canceled.connect(self.worker.cancel, Qt.DirectConnection)
+        self.worker.progress.connect(self.show_progress)
+        self.worker.finished.connect(self.stop_worker)
+        self.worker.failed.connect(self.stop_worker)
+        self.worker.finished.connect(on_finished)
+        self.worker.failed.connect(self.worker_failed)
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker_thread.start()
+
+    def show_progress(self, done, total):
+        if self.progress_dialog is not None:
+            self.progress_dialog.setMaximum(total)
+            self.progress_dialog.setValue(done)
+
+    def stop_worker(self, *args):
+        self.progress_dialog.canceled.disconnect()
+        self.progress_dialog.close()
+        self.progress_dialog.deleteLater()
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        self.worker_thread.deleteLater()
+        self.worker.deleteLater()
+        self.progress_dialog = None
+        self.worker_thread = None
+        self.worker = None
+        if self.profile_start is not None:
+            self.profile_label.setText(profiling.status_text(profiling.since(self.profile_start)))
+            self.profile_start = None
+        if self.close_pending:
+            # Queued so the worker's own finished/failed handlers run first
+            QTimer.singleShot(0, self.close)
+
+    def closeEvent(self, event):
+        # A running load or save finishes before the window closes and the session is released
+        if self.worker is not None:
+            self.close_pending = True
+            event.ignore()
+            return
+        self.release_roster()
+        event.accept()
+
+    def worker_failed(self, message):
+        self.mark_applied()
+        QMessageBox.critical(self, "Roster File", message)
 
 
 if __name__ == '__main__':
     try:
-        app = QApplication(sys.argv)
-        roster_editor = RosterEditor()
-        roster_editor.show()
-        sys.exit(app.exec_())
+        parser = argparse.ArgumentParser(description="Edit College Hoops 2k8 USERDATA rosters.")
+        profiling.add_argument(parser)
+        # Anything else is left for Qt
+        args, qt_args = parser.parse_known_args()
+        app = QApplication(sys.argv[:1] + qt_args)
+        sys.exit(profiling.run(args.profile, run_editor, app))
     except Exception as e:
         print(f"Error: {e}")
@@ -1,43 +1,99 @@
 import struct
 
+from roster_file import (
+    CONFERENCE_BLOCK_LENGTH,
+    CONFERENCE_INFO_TABLE_END,
+    CONFERENCE_INFO_TABLE_START,
+    read_utf16le_string,
+)
+
+# (attribute, offset in the block, struct code). Both pointers are relative to
+# their own 4-byte slot, like the team string pointers.
+CONFERENCE_LAYOUT = (
+    ("conference_name_ptr", 0, "I"),
+    ("conference_abbr_ptr", 4, "I"),
+    ("type", 10, "H"),
+    ("sort_order", 12, "H"),
+    ("founded", 14, "H"),
+    ("champs_order", 16, "H"),
+    ("final_fours", 18, "H"),
+    ("prev_yr_bids", 20, "H"),
+    ("rank", 22, "H"),
+    ("last_champ_order", 24, "H"),
+    ("presentation_id", 26, "H"),
+    ("tourney_slots", 28, "H"),
+    ("tourney_day", 30, "H"),
+    ("red", 32, "B"),
+    ("green", 33, "B"),
+    ("blue", 34, "B"),
+)
+CONFERENCE_FIELDS = tuple(name for name, _, _ in CONFERENCE_LAYOUT)
+CONFERENCE_VALUE_FIELDS = CONFERENCE_FIELDS[2:]
+FIELD_STRUCTS = {name: (offset, struct.Struct(">" + code)) for name, offset, code in CONFERENCE_LAYOUT}
+# Largest value each unsigned field can hold
+CONFERENCE_VALUE_MAXIMUMS = tuple((1 << 8 * struct.calcsize(code)) - 1 for _, _, code in CONFERENCE_LAYOUT[2:])
+
+
+def layout_struct(layout):
+    fmt = ">"
+    position = 0
+    for _, offset, code in layout:
+        if offset > position:
+            fmt += "%dx" % (offset - position)
+        fmt += code
+        position = offset + struct.calcsize(code)
+    return struct.Struct(fmt)
+
+
+CONFERENCE_STRUCT = layout_struct(CONFERENCE_LAYOUT)
+
 
 class Conference:
+    __slots__ = ("file_data", "offset") + CONFERENCE_FIELDS
+
     def __init__(self, file_data, offset):
         self.file_data = file_data
         self.offset = offset
+        (
+            self.conference_name_ptr,
+            self.conference_abbr_ptr,
+            self.type,
+            self.sort_order,
+            self.founded,
+            self.champs_order,
+            self.final_fours,
+            self.prev_yr_bids,
+            self.rank,
+            self.last_champ_order,
+            self.presentation_id,
+            self.tourney_slots,
+            self.tourney_day,
+            self.red,
+            self.green,
+            self.blue,
+        ) = CONFERENCE_STRUCT.unpack_from(file_data, offset)
+
+    @property
+    def name_pointer(self):
+        return self.offset + self.conference_name_ptr
+
+    @property
+    def abbr_pointer(self):
+        return self.offset + 4 + self.conference_abbr_ptr
 
-        self.conference_name_ptr = self.read_pointer(offset)
-        self.conference_abbr_ptr = self.read_pointer(offset + 4)
-        self.type = self.read_short(offset + 10)
-        self.sort_order = self.read_short(offset + 12)
-        self.founded = self.read_short(offset + 14)
-        self.champs_order = self.read_short(offset + 16)
-        self.final_fours = self.read_short(offset + 18)
-        self.prev_yr_bids = self.read_short(offset + 20)
-        self.rank = self.read_short(offset + 22)
-        self.last_champ_order = self.read_short(offset + 24)
-        self.presentation_id = self.read_short(offset + 26)
-        self.tourney_slots = self.read_short(offset + 28)
-        self.tourney_day = self.read_short(offset + 30)
-        self.red = self.read_byte(offset + 32)
-        self.green = self.read_byte(offset + 33)
-        self.blue = self.read_byte(offset + 34)
-
-    def read_pointer(self, offset):
-        return struct.unpack(">I", self.file_data[offset:offset + 4])[0]
-
-    def read_short(self, offset):
-        return struct.unpack(">H", self.file_data[offset:offset + 2])[0]
-
-    def read_byte(self, offset):
-        return struct.unpack("B", self.file_data[offset:offset + 1])[0]
+    def values(self):
+        return tuple(getattr(self, name) for name in CONFERENCE_VALUE_FIELDS)
 
     def get_conference_name(self):
-        return self.read_string(self.conference_name_ptr)
+        return read_utf16le_string(self.file_data, self.name_pointer)
 
     def get_conference_abbr(self):
-        return self.read_string(self.conference_abbr_ptr)
+        return read_utf16le_string(self.file_data, self.abbr_pointer)
+
+
+def conference_offsets(start=CONFERENCE_INFO_TABLE_START, end=CONFERENCE_INFO_TABLE_END):
+    return range(start, end, CONFERENCE_BLOCK_LENGTH)
+
 
-    def read_string(self, pointer):
-        end = self.file_data.index(b'\x00', pointer)
-        return self.file_data[pointer:end].decode('utf-8')
+def read_conferences(file_data, start=CONFERENCE_INFO_TABLE_START, end=CONFERENCE_INFO_TABLE_END):
+    return [Conference(file_data, offset) for offset in conference_offsets(start, end)]
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "ch2k8-roster-editor",
+    "parse_cache.sqlite3",
+)
+# Entries for the least recently used files beyond this many are dropped.
+MAX_FILES = 32
+# Bump when a cached value changes shape, so old entries are ignored.
+FORMAT_VERSION = 3
+
+
+def file_digest(data):
+    return "%d-%s" % (len(data), hashlib.blake2b(data, digest_size=16).hexdigest())
+
+
+class ParseCache:
+    # Decoded data keyed by (file digest, kind, params) in a local SQLite
+    # file. Values are pickled. An entry stays valid as long as the file's
+    # size and hash match, so there is nothing to invalidate by hand.
+    def __init__(self, path=CACHE_PATH, max_files=MAX_FILES):
+        self.path = path
+        self.max_files = max_files
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=5)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "digest TEXT, kind TEXT, params TEXT, version INTEGER, used REAL, value BLOB, "
+            "PRIMARY KEY (digest, kind, params))"
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, digest, kind, params=""):
+        # Returns None on a miss.
+        try:
+            row = self.connection.execute(
+                "SELECT value FROM entries WHERE digest = ? AND kind = ? AND params = ? AND version = ?",
+                (digest, kind, params, FORMAT_VERSION),
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE entries SET used = ? WHERE digest = ?", (time.time(), digest))
+            self.connection.commit()
+            return pickle.loads(row[0])
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError):
+            return None
+
+    def put(self, digest, kind, value, params=""):
+        # A cache that cannot be written only costs speed.
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, kind, params, FORMAT_VERSION, time.time(),
+                 pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+            )
+            self.connection.execute(
+                "DELETE FROM entries WHERE digest NOT IN ("
+                "SELECT digest FROM entries GROUP BY digest ORDER BY MAX(used) DESC LIMIT ?)",
+                (self.max_files,),
+            )
+            self.connection.commit()
+        except sqlite3.Error:
+            pass
+
+
+def open_cache(path=CACHE_PATH):
+    # None when the cache cannot be used at all, e.g. a read-only home.
+    if not path:
+        return None
+    try:
+        return ParseCache(path)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+def params_key(*values):
+    # A short key for the options an entry was built with.
+    return hashlib.blake2b(repr(values).encode("utf-8"), digest_size=8).hexdigest()
@@ -0,0 +1,147 @@
+import contextlib
+import sys
+import time
+
+# Off unless a tool is run with --profile. While off, span() hands back one
+# shared no-op context and count() returns straight away.
+enabled = False
+spans = {}
+counters = {}
+_DISABLED = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.started
+        total = spans.get(self.name)
+        if total is None:
+            spans[self.name] = [1, elapsed]
+        else:
+            total[0] += 1
+            total[1] += elapsed
+
+
+def span(name):
+    return _Span(name) if enabled else _DISABLED
+
+
+def count(name, amount=1):
+    if enabled:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    spans.clear()
+    counters.clear()
+
+
+def snapshot():
+    return {
+        "spans": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in spans.items()},
+        "counters": dict(counters),
+    }
+
+
+def take():
+    # Snapshot and reset, e.g. to hand a worker process's numbers back.
+    data = snapshot()
+    reset()
+    return data
+
+
+def merge(data):
+    for name, value in data["spans"].items():
+        total = spans.setdefault(name, [0, 0.0])
+        total[0] += value["calls"]
+        total[1] += value["seconds"]
+    for name, value in data["counters"].items():
+        counters[name] = counters.get(name, 0) + value
+
+
+def since(previous):
+    # What was recorded after the previous snapshot.
+    data = snapshot()
+    for name, value in previous["spans"].items():
+        current = data["spans"].get(name)
+        if current is not None:
+            current["calls"] -= value["calls"]
+            current["seconds"] -= value["seconds"]
+    for name, value in previous["counters"].items():
+        if name in data["counters"]:
+            data["counters"][name] -= value
+    data["spans"] = {name: value for name, value in data["spans"].items() if value["calls"]}
+    data["counters"] = {name: value for name, value in data["counters"].items() if value}
+    return data
+
+
+def summary_lines(data=None):
+    data = snapshot() if data is None else data
+    lines = []
+    for name, value in sorted(data["spans"].items(), key=lambda item: -item[1]["seconds"]):
+        lines.append(f"{name:<28} {value['calls']:>8} call(s) {value['seconds'] * 1000:>10.2f} ms")
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"{name:<28} {value:>8}")
+    return lines
+
+
+def status_text(data=None):
+    data = snapshot() if data is None else data
+    parts = [
+        f"{name} {value['seconds'] * 1000:.1f} ms"
+        for name, value in sorted(data["spans"].items(), key=lambda item: -item[1]["seconds"])
+    ]
+    parts += [f"{name} {value}" for name, value in sorted(data["counters"].items())]
+    return ", ".join(parts)
+
+
+def add_argument(parser):
+    parser.add_argument(
+        "--profile", nargs="?", const="-", metavar="PATH",
+        help="Print a per-phase timing breakdown to stderr; with PATH also write it as JSON, "
+        "or as cProfile stats when PATH ends in .prof.",
+    )
+
+
+def run(path, func, *args):
+    # Calls func(*args), profiled when path is set (see add_argument).
+    if path is None:
+        return func(*args)
+    # Not needed unless profiling, so tools don't pay for them at startup
+    import cProfile
+    import json
+
+    reset()
+    enable()
+    profiler = cProfile.Profile() if path.endswith(".prof") else None
+    try:
+        if profiler is None:
+            return func(*args)
+        return profiler.runcall(func, *args)
+    finally:
+        disable()
+        if profiler is not None:
+            profiler.dump_stats(path)
+        elif path != "-":
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(snapshot(), file, indent=2)
+        for line in summary_lines():
+            print(line, file=sys.stderr)
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+
+from conferences import CONFERENCE_LAYOUT, layout_struct
+from roster_file import read_utf16le_string
+from roster_layout import RosterLayout, detect_layout
+
+# Field code for a u32 pointer, relative to its own slot, to a UTF-16LE string.
+STRING = "S"
+PAGE_SIZE = 32
+MAX_PAGES = 64
+
+LAYOUTS = {}
+
+
+class RecordLayout:
+    # A table of fixed-size records: where it starts, how many records of
+    # which stride, and the (name, offset, code) of each field, codes being
+    # struct codes or STRING.
+    def __init__(self, name, start, count, stride, fields):
+        self.name = name
+        self.start = start
+        self.count = count
+        self.stride = stride
+        self.fields = tuple(fields)
+        self.names = tuple(field_name for field_name, _, _ in self.fields)
+        self.positions = {field_name: position for position, field_name in enumerate(self.names)}
+        self.string_fields = frozenset(field_name for field_name, _, code in self.fields if code == STRING)
+        self.struct = layout_struct(
+            [(field_name, offset, "I" if code == STRING else code) for field_name, offset, code in self.fields]
+        )
+
+    def offset(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("%s record %d out of range" % (self.name, index))
+        return self.start + index * self.stride
+
+    def index_of(self, offset):
+        index, remainder = divmod(offset - self.start, self.stride)
+        if remainder or not 0 <= index < self.count:
+            raise KeyError("No %s record at offset %#x" % (self.name, offset))
+        return index
+
+
+class Record:
+    # Fields are decoded on first access, through the table's page cache.
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def offset(self):
+        return self.table.layout.offset(self.index)
+
+    def __getattr__(self, name):
+        if name not in self.table.layout.positions:
+            raise AttributeError(name)
+        return self.table.field(self.index, name)
+
+    def as_dict(self):
+        return {name: self.table.field(self.index, name) for name in self.table.layout.names}
+
+
+class RecordTable:
+    # A layout bound to one roster buffer. Records are unpacked a page at a
+    # time, each page keeping the strings decoded from it, and the least
+    # recently used pages are dropped past max_pages.
+    def __init__(self, layout, data, page_size=PAGE_SIZE, max_pages=MAX_PAGES):
+        self.layout = layout
+        self.data = data
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+
+    def __len__(self):
+        return self.layout.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.layout.count
+        self.layout.offset(index)
+        return Record(self, index)
+
+    def __iter__(self):
+        return (Record(self, index) for index in range(self.layout.count))
+
+    def at_offset(self, offset):
+        return Record(self, self.layout.index_of(offset))
+
+    def _page(self, page_number):
+        page = self.pages.get(page_number)
+        if page is not None:
+            self.pages.move_to_end(page_number)
+            return page
+        layout = self.layout
+        first = page_number * self.page_size
+        last = min(first + self.page_size, layout.count)
+        unpack_from = layout.struct.unpack_from
+        rows = [unpack_from(self.data, layout.start + index * layout.stride) for index in range(first, last)]
+        # The page's decoded strings are dropped along with its rows.
+        page = self.pages[page_number] = (rows, {})
+        if len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        return page
+
+    def raw(self, index, name):
+        page_number, row = divmod(index, self.page_size)
+        return self._page(page_number)[0][row][self.layout.positions[name]]
+
+    def pointer(self, index, name):
+        # Where a STRING field's string starts.
+        slot = self.layout.offset(index) + self.layout.fields[self.layout.positions[name]][1]
+        return slot + self.raw(index, name)
+
+    def field(self, index, name):
+        if name not in self.layout.string_fields:
+            return self.raw(index, name)
+        page_number, row = divmod(index, self.page_size)
+        strings = self._page(page_number)[1]
+        string = strings.get((row, name))
+        if string is None:
+            string = strings[row, name] = read_utf16le_string(self.data, self.pointer(index, name))
+        return string
+
+    def invalidate(self):
+        # Call after writing to the buffer.
+        self.pages.clear()
+
+
+def register(name, fields, offsets):
+    # offsets gives the range of record offsets from a RosterLayout, so the
+    # table follows the layout detected in each roster.
+    LAYOUTS[name] = (tuple(fields), offsets)
+
+
+def table_layout(name, roster_layout):
+    fields, offsets = LAYOUTS[name]
+    offsets = offsets(roster_layout)
+    return RecordLayout(name, offsets.start, len(offsets), offsets.step, fields)
+
+
+def open_table(name, data, roster_layout=None):
+    # Pass the layout a session or dump already detected to skip the search.
+    if roster_layout is None:
+        roster_layout = detect_layout(data)
+    return RecordTable(table_layout(name, roster_layout), data)
+
+
+register(
+    "teams",
+    [
+        ("team_name", 0, STRING),
+        ("team_abbr", 4, STRING),
+        ("team_name_2", 8, STRING),
+        ("nickname", 12, STRING),
+        ("mascot", 16, STRING),
+    ],
+    RosterLayout.team_offsets,
+)
+
+register(
+    "conferences",
+    [("name", 0, STRING), ("abbr", 4, STRING)] + list(CONFERENCE_LAYOUT[2:]),
+    RosterLayout.conference_offsets,
+)
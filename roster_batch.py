@@ -0,0 +1,108 @@
+import argparse
+import io
+import os
+import sys
+
+from roster_session import RosterSession, read_team_edits
+
+
+def load_team_edits(path):
+    # The CSV is read once and parsed per roster: offset_hex rows are
+    # matched against each file's own team table.
+    with open(path, newline="", encoding="utf-8") as file:
+        return file.read()
+
+
+def apply_team_edits(session, edits):
+    changed = 0
+    for team_index, values in read_team_edits(io.StringIO(edits, newline=""), session.team_offsets):
+        if not 0 <= team_index < len(session.team_offsets):
+            raise ValueError("Team index %d out of range" % team_index)
+        for field_index, value in values:
+            if session.set_team_string(team_index, field_index, value):
+                changed += 1
+    return changed
+
+
+def output_paths(input_paths, output_dir):
+    if output_dir is None:
+        return list(input_paths)
+    # Mirror the inputs below their common folder, so league folders stay
+    # apart when every input is called USERDATA.
+    directories = [os.path.dirname(os.path.abspath(path)) for path in input_paths]
+    base = os.path.commonpath(directories)
+    return [os.path.join(output_dir, os.path.relpath(os.path.abspath(path), base)) for path in input_paths]
+
+
+def edit_file(input_path, out_path, edits, atomic=False, compact=False):
+    # Returns the number of fields changed and the compaction, if asked for.
+    # Every file is edited once, so the parse cache would only be churned.
+    with RosterSession(input_path, cache_path=None) as session:
+        changed = apply_team_edits(session, edits)
+        compaction = session.compact_strings() if compact else None
+        if session.is_dirty or out_path != input_path:
+            directory = os.path.dirname(out_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            session.save(out_path, atomic=atomic)
+    return changed, compaction
+
+
+def _edit_file_job(input_path, out_path, edits, atomic, compact):
+    try:
+        return (input_path,) + edit_file(input_path, out_path, edits, atomic, compact) + (None,)
+    except (OSError, ValueError) as e:
+        return input_path, 0, None, str(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Apply team string edits from a teams.csv file to many USERDATA roster files."
+    )
+    parser.add_argument(
+        "--csv", default="teams.csv", help="CSV in the teams.csv layout from roster_dump.py, or an editor export."
+    )
+    parser.add_argument("inputs", nargs="+", help="USERDATA roster files to edit.")
+    parser.add_argument(
+        "--output-dir", help="Write edited copies under this directory instead of editing in place."
+    )
+    parser.add_argument("--jobs", type=int, default=0, help="Worker processes (0 uses every CPU).")
+    parser.add_argument(
+        "--safe", action="store_true", help="Write each file to a temporary copy and rename it into place."
+    )
+    parser.add_argument(
+        "--compact", action="store_true",
+        help="After editing, pack the strings the editor has written into one run and drop orphaned ones.",
+    )
+    args = parser.parse_args()
+
+    edits = load_team_edits(args.csv)
+    jobs = min(args.jobs or os.cpu_count() or 1, len(args.inputs))
+    tasks = [
+        (path, out_path, edits, args.safe, args.compact)
+        for path, out_path in zip(args.inputs, output_paths(args.inputs, args.output_dir))
+    ]
+
+    if jobs <= 1:
+        results = [_edit_file_job(*task) for task in tasks]
+    else:
+        # Worker processes are only imported when they are used
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_edit_file_job, *zip(*tasks)))
+
+    failures = 0
+    for path, changed, compaction, error in results:
+        if error is None and compaction is not None:
+            print(f"{path}: {changed} field(s) changed, {compaction.reclaimed} byte(s) reclaimed")
+        elif error is None:
+            print(f"{path}: {changed} field(s) changed")
+        else:
+            failures += 1
+            print(f"{path}: {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import statistics
+import string
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from conferences import conference_offsets
+from roster_dump import parse_teams
+from roster_file import (
+    STRING_POOL_START,
+    TEAM_FIELD_COUNT,
+    RosterFile,
+    team_offsets,
+)
+from roster_session import CONFERENCE_STRING_FIELDS, RosterSession
+from roster_string_scan import scan_for_strings
+from string_pool import StringPoolIndex
+from team_records import StringTable, read_team_records
+
+# Same size as the game's USERDATA.
+SYNTHETIC_LENGTH = 0x3DF804
+BE_U32 = struct.Struct(">I")
+# Modules the command-line tools start from, and how long importing one may
+# take before it is reported.
+IMPORT_MODULES = ("roster_file", "roster_session", "roster_dump", "roster_string_scan", "roster_batch", "roster_patch")
+IMPORT_BUDGET = 0.1
+# Numbers the team names of each hold:cycle session, across every run.
+CYCLES = itertools.count()
+
+
+def random_word(rng, min_length, max_length, alphabet=string.ascii_letters):
+    return "".join(rng.choices(alphabet, k=rng.randint(min_length, max_length)))
+
+
+def generate_roster(path, team_count=len(team_offsets()), fill=0.5, seed=0, length=SYNTHETIC_LENGTH):
+    # Writes a roster with the real table layout: team_count teams with five
+    # strings each (the rest of the table points at an empty string), named
+    # conferences, and filler strings until `fill` of the string pool and the
+    # data region after it is in use. Strings sit at odd offsets like the
+    # game's and identical strings share one pointer.
+    slots = team_offsets()
+    if not 0 <= team_count <= len(slots):
+        raise ValueError("Team count must be between 0 and %d" % len(slots))
+    rng = random.Random(seed)
+    data = bytearray(length)
+    BE_U32.pack_into(data, 0, length - 4)
+    pool = {}
+    cursor = STRING_POOL_START + 1
+
+    def intern(value):
+        nonlocal cursor
+        pointer = pool.get(value)
+        if pointer is None:
+            encoded = value.encode("utf-16-le") + b"\x00\x00"
+            if cursor + len(encoded) > length:
+                raise ValueError("Synthetic roster is too small for its strings")
+            pointer = pool[value] = cursor
+            data[cursor:cursor + len(encoded)] = encoded
+            cursor += len(encoded)
+        return pointer
+
+    def point(slot, value):
+        BE_U32.pack_into(data, slot, intern(value) - slot)
+
+    for team_index, team_offset in enumerate(slots):
+        if team_index < team_count:
+            name = random_word(rng, 5, 16)
+            values = [
+                name,
+                random_word(rng, 2, 4, string.ascii_uppercase),
+                name if rng.random() < 0.5 else random_word(rng, 5, 16),
+                random_word(rng, 4, 12),
+                random_word(rng, 6, 20),
+            ]
+        else:
+            values = [""] * TEAM_FIELD_COUNT
+        for field_index, value in enumerate(values):
+            point(team_offset + field_index * 4, value)
+
+    for conference_index, conference_offset in enumerate(conference_offsets()):
+        values = ["Conference %d" % conference_index, "C%d" % conference_index]
+        for field_index in range(CONFERENCE_STRING_FIELDS):
+            point(conference_offset + field_index * 4, values[field_index])
+
+    target = STRING_POOL_START + int((length - STRING_POOL_START) * fill)
+    while cursor < target:
+        encoded = random_word(rng, 2, 32).encode("utf-16-le")[:(target - cursor) // 2 * 2]
+        data[cursor:cursor + len(encoded)] = encoded
+        cursor += len(encoded) + 2
+
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def edit_rename(teams):
+    return [("teams", row, 0, "Renamed %d" % row) for row in range(len(teams))]
+
+
+def edit_grow_mascot(teams):
+    return [("teams", row, 4, team[4] + " II") for row, team in enumerate(teams)]
+
+
+def edit_swap_abbr(teams):
+    # Every abbreviation takes the next team's, so each lands on a string
+    # that is already in the pool.
+    return [("teams", row, 1, teams[(row + 1) % len(teams)][1]) for row in range(len(teams))]
+
+
+EDIT_SETS = {
+    "rename": edit_rename,
+    "grow-mascot": edit_grow_mascot,
+    "swap-abbr": edit_swap_abbr,
+}
+
+
+# Each benchmark prepares its inputs outside the measurement and returns
+# (run, cleanup).
+
+
+def bench_open(path, work_dir):
+    def run():
+        with RosterSession(path, cache_path=None) as session:
+            return session.read_teams(), session.read_conferences()
+
+    return run, None
+
+
+def bench_open_cached(path, work_dir):
+    # Reopening an unchanged roster, served from a warm parse cache.
+    cache_path = os.path.join(work_dir, "parse_cache.sqlite3")
+    RosterSession(path, cache_path=cache_path).close()
+
+    def run():
+        with RosterSession(path, cache_path=cache_path) as session:
+            return session.read_teams(), session.read_conferences()
+
+    return run, None
+
+
+def bench_parse_teams(path, work_dir):
+    roster = RosterFile(path)
+    return (lambda: parse_teams(roster, roster.team_offsets())), roster.close
+
+
+def bench_scan(path, work_dir):
+    roster = RosterFile(path)
+    known = {value for team in roster.read_teams() for value in team}
+    return (lambda: scan_for_strings(roster.buffer, known, 2, 64)), roster.close
+
+
+def bench_string_index(path, work_dir):
+    roster = RosterFile(path)
+    return (lambda: StringPoolIndex(roster.buffer, STRING_POOL_START)), roster.close
+
+
+def bench_find_string(path, work_dir):
+    roster = RosterFile(path)
+    index = StringPoolIndex(roster.buffer, STRING_POOL_START)
+    encoded = [
+        (value + suffix).encode("utf-16-le", "surrogatepass") + b"\x00\x00"
+        for team in roster.read_teams()
+        for value in team
+        for suffix in ("", " (missing)")
+    ]
+    return (lambda: [index.find(value) for value in encoded]), roster.close
+
+
+def edit_benchmark(edit_set):
+    def bench(path, work_dir):
+        # Edits and saves a fresh copy each time, like the editor's Save.
+        copy_path = os.path.join(work_dir, "USERDATA.edit")
+        shutil.copyfile(path, copy_path)
+        session = RosterSession(copy_path, cache_path=None)
+        edits = EDIT_SETS[edit_set](session.read_teams())
+
+        def run():
+            applied = session.apply_edits(edits)
+            session.save()
+            return applied
+
+        return run, session.close
+
+    return bench
+
+
+def read_team_tuples(rosters):
+    return [roster.read_teams() for roster in rosters]
+
+
+def read_shared_records(rosters):
+    # One string table for all of them, as when comparing variants.
+    strings = StringTable()
+    return [read_team_records(roster, roster.team_offsets(), strings) for roster in rosters]
+
+
+def cycle_benchmark(count):
+    def bench(path, work_dir):
+        # Opens `count` sessions in turn, renames every team to names no
+        # earlier session has seen (left unsaved), reads the teams back and
+        # closes the session; whatever is still held afterwards outlived it.
+        def run():
+            for _ in range(count):
+                cycle = next(CYCLES)
+                with RosterSession(path, cache_path=None) as session:
+                    teams = session.read_teams()
+                    session.apply_edits([("teams", row, 0, "Cycle %d-%d" % (cycle, row)) for row in range(len(teams))])
+                    session.read_teams(), session.read_conferences()
+
+        return run, None
+
+    return bench
+
+
+def hold_benchmark(read, count):
+    def bench(path, work_dir):
+        # The teams of `count` rosters held at once; retained memory is what
+        # holding them costs.
+        rosters = [RosterFile(path) for _ in range(count)]
+
+        def cleanup():
+            for roster in rosters:
+                roster.close()
+
+        return (lambda: read(rosters)), cleanup
+
+    return bench
+
+
+BENCHMARKS = {
+    "open": bench_open,
+    "open_cached": bench_open_cached,
+    "parse_teams": bench_parse_teams,
+    "scan_for_strings": bench_scan,
+    "string_index": bench_string_index,
+    "find_string": bench_find_string,
+}
+
+
+def measure(bench, path, work_dir, repeat):
+    times = []
+    for _ in range(repeat):
+        run, cleanup = bench(path, work_dir)
+        try:
+            started = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - started)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    # One more run under tracemalloc, which would skew the timings. Memory
+    # mapped file data is not a Python allocation and is not counted.
+    run, cleanup = bench(path, work_dir)
+    try:
+        tracemalloc.start()
+        try:
+            result = run()
+            current, peak = tracemalloc.get_traced_memory()
+            blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        finally:
+            tracemalloc.stop()
+        del result
+    finally:
+        if cleanup is not None:
+            cleanup()
+
+    return {
+        "min_seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "peak_bytes": peak,
+        "retained_bytes": current,
+        "retained_blocks": blocks,
+    }
+
+
+def measure_import(module, repeat):
+    # Each run imports the module in a fresh interpreter and reads its
+    # cumulative time from -X importtime, so interpreter startup is left out.
+    code = "import sys, %s; print(any(name.split('.')[0] == 'PyQt5' for name in sys.modules))" % module
+    times = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        for line in completed.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == module:
+                times.append(int(fields[1]) / 1e6)
+    return {
+        "min_seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "qt_loaded": completed.stdout.strip() == "True",
+    }
+
+
+def import_problems(imports, budget=IMPORT_BUDGET):
+    problems = []
+    for module, result in imports.items():
+        if result["qt_loaded"]:
+            problems.append(f"{module}: imports PyQt5")
+        if result["median_seconds"] > budget:
+            problems.append(f"{module}: imports in {result['median_seconds'] * 1000:.1f} ms")
+    return problems
+
+
+def run_suite(datasets, benchmarks, repeat, report=print):
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="roster-bench-")
+    try:
+        for label, path in datasets:
+            results[label] = {}
+            for name, bench in benchmarks.items():
+                try:
+                    results[label][name] = measure(bench, path, work_dir, repeat)
+                except ValueError as e:
+                    # e.g. an edit set that does not fit a nearly full pool
+                    results[label][name] = {"error": str(e)}
+                report(format_result(label, name, results[label][name]))
+    finally:
+        shutil.rmtree(work_dir)
+    return results
+
+
+def format_result(label, name, result):
+    if "error" in result:
+        return f"{label:<28} {name:<24} error: {result['error']}"
+    return (
+        f"{label:<28} {name:<24} {result['median_seconds'] * 1000:>10.2f} ms"
+        f" {result['peak_bytes'] / 1024:>10.1f} KiB peak"
+        f" {result['retained_bytes'] / 1024:>10.1f} KiB held"
+        f" {result['retained_blocks']:>8} blocks"
+    )
+
+
+def compare_results(baseline, results, tolerance):
+    # Returns one line per benchmark that got slower, or used more memory,
+    # than tolerance times its baseline.
+    regressions = []
+    for label, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            old = baseline.get(label, {}).get(name)
+            if not old or "error" in old or "error" in result:
+                continue
+            for key in ("median_seconds", "peak_bytes", "retained_bytes"):
+                if old.get(key) and result[key] > old[key] * tolerance:
+                    regressions.append(f"{label} {name}: {key} {old[key]:.6g} -> {result[key]:.6g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the roster readers, scanners and edit paths on real or synthetic USERDATA files."
+    )
+    parser.add_argument("--input", nargs="+", default=[], help="Existing USERDATA files to benchmark.")
+    parser.add_argument(
+        "--teams", type=int, default=len(team_offsets()), help="Teams filled in each synthetic roster."
+    )
+    parser.add_argument(
+        "--fill", type=float, nargs="+", default=[0.5],
+        help="String pool fill levels (0-1); one synthetic roster per level.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic strings.")
+    parser.add_argument(
+        "--no-synthetic", action="store_true", help="Only benchmark the --input files."
+    )
+    parser.add_argument("--save-synthetic", help="Also copy the synthetic rosters into this directory.")
+    parser.add_argument(
+        "--edits", nargs="*", choices=sorted(EDIT_SETS), default=sorted(EDIT_SETS), help="Edit sets to apply and save."
+    )
+    parser.add_argument(
+        "--hold", type=int, default=8,
+        help="Rosters held open at once by the hold benchmarks, which compare team tuples with shared records, "
+        "and sessions opened and closed in turn by hold:cycle (0 skips them).",
+    )
+    parser.add_argument(
+        "--imports", action="store_true",
+        help="Also time importing each command-line module in a fresh interpreter and report any that load "
+        "PyQt5 or take over %d ms." % (IMPORT_BUDGET * 1000),
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark.")
+    parser.add_argument("--json-out", default="bench_baseline.json", help="Where to write the results.")
+    parser.add_argument("--compare", help="Baseline JSON to check the results against.")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.25, help="Slowdown or memory growth ratio reported as a regression."
+    )
+    args = parser.parse_args()
+
+    benchmarks = dict(BENCHMARKS)
+    for edit_set in args.edits:
+        benchmarks["edit:" + edit_set] = edit_benchmark(edit_set)
+    if args.hold > 0:
+        benchmarks["hold:tuples"] = hold_benchmark(read_team_tuples, args.hold)
+        benchmarks["hold:records"] = hold_benchmark(read_shared_records, args.hold)
+        benchmarks["hold:cycle"] = cycle_benchmark(args.hold)
+
+    data_dir = tempfile.mkdtemp(prefix="roster-bench-data-")
+    try:
+        datasets = [(os.path.basename(path) if len(args.input) == 1 else path, path) for path in args.input]
+        if not args.no_synthetic:
+            for fill in args.fill:
+                label = f"synthetic-t{args.teams}-f{fill:.2f}"
+                path = os.path.join(data_dir, label)
+                try:
+                    generate_roster(path, args.teams, fill, args.seed)
+                except ValueError as e:
+                    parser.error(str(e))
+                if args.save_synthetic:
+                    os.makedirs(args.save_synthetic, exist_ok=True)
+                    shutil.copyfile(path, os.path.join(args.save_synthetic, label))
+                datasets.append((label, path))
+        if not datasets and not args.imports:
+            parser.error("nothing to benchmark")
+        results = run_suite(datasets, benchmarks, args.repeat)
+    finally:
+        shutil.rmtree(data_dir)
+
+    imports = {}
+    if args.imports:
+        for module in IMPORT_MODULES:
+            imports[module] = measure_import(module, args.repeat)
+            print(f"{'imports':<28} {module:<24} {imports[module]['median_seconds'] * 1000:>10.2f} ms")
+
+    payload = {
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+        "imports": imports,
+    }
+    with open(args.json_out, "w", encoding="utf-8") as file:
+        json.dump(payload, file, indent=2)
+
+    regressions = import_problems(imports)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions += compare_results(baseline["results"], results, args.tolerance)
+        regressions += compare_results(
+            {"imports": baseline.get("imports", {})}, {"imports": imports}, args.tolerance
+        )
+    for line in regressions:
+        print("regression: " + line, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
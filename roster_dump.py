@@ -3,34 +3,25 @@ import binascii
 import json
 import re
 
-TEAM_BLOCK_LENGTH = 0x2C0
-TEAM_OFFSETS_FILE = "team_offsets.txt"
-USERDATA_FILE = "USERDATA"
-
-CONFERENCE_INFO_TABLE_START = 0x34597C
-CONFERENCE_INFO_TABLE_END = 0x361198
-CONFERENCE_BLOCK_LENGTH = 0xB94
-
-
-def read_be_u32(data, offset):
-    return int.from_bytes(data[offset:offset + 4], byteorder="big", signed=False)
+import profiling
+from conferences import CONFERENCE_VALUE_FIELDS
+from roster_file import (
+    TEAM_BLOCK_LENGTH,
+    RosterFile,
+    is_printable_string,
+)
+from parse_cache import file_digest, open_cache, params_key
+from record_layouts import open_table
+from roster_layout import DEFAULT_LAYOUT, detect_layout
+from team_records import TeamRecords
 
-
-def read_utf16le_string(data, pointer, max_bytes=256):
-    output = bytearray()
-    while pointer + 2 <= len(data) and len(output) < max_bytes:
-        if data[pointer:pointer + 2] == b"\x00\x00":
-            break
-        output.extend(data[pointer:pointer + 2])
-        pointer += 2
-    return output.decode("utf-16-le", errors="replace")
+USERDATA_FILE = "USERDATA"
+STRING_MAX_BYTES = 256
 
 
-def is_printable_string(value):
-    if not value:
-        return False
-    printable = sum(1 for ch in value if ch.isprintable())
-    return printable / len(value) >= 0.85
+def read_dump_string(roster, pointer):
+    profiling.count("strings.decoded")
+    return roster.read_string(pointer, max_bytes=STRING_MAX_BYTES, errors="replace")
 
 
 def load_team_offsets(path):
@@ -51,16 +42,17 @@ def chunked_hex(data, width=16):
     return lines
 
 
-def scan_for_extra_strings(data, team_offset, known_strings):
+def scan_for_extra_strings(roster, team_offset, known_strings):
     extras = []
     seen = set()
+    profiling.count("dump.pointers_checked", TEAM_BLOCK_LENGTH // 4)
     for offset in range(0, TEAM_BLOCK_LENGTH, 4):
         pointer_offset = team_offset + offset
-        pointer_value = read_be_u32(data, pointer_offset)
+        pointer_value = roster.read_u32(pointer_offset)
         string_pointer = pointer_offset + pointer_value
-        if not (0 <= string_pointer < len(data)):
+        if not (0 <= string_pointer < len(roster)):
             continue
-        candidate = read_utf16le_string(data, string_pointer)
+        candidate = read_dump_string(roster, string_pointer)
         if not candidate or len(candidate) > 64:
             continue
         if candidate in known_strings:
@@ -82,30 +74,29 @@ def scan_for_extra_strings(data, team_offset, known_strings):
     return extras
 
 
-def parse_teams(data, team_offsets):
-    teams = []
+def iter_teams(roster, team_offsets, include_block_hex=True):
     for team_index, team_offset in enumerate(team_offsets):
-        strings = []
-        pointers = []
-        for field_index in range(5):
-            pointer_offset = team_offset + field_index * 4
-            pointer_value = read_be_u32(data, pointer_offset)
-            string_pointer = pointer_offset + pointer_value
-            string_value = read_utf16le_string(data, string_pointer)
-            strings.append(string_value)
-            pointers.append(
-                {
-                    "field_index": field_index,
-                    "pointer_offset": pointer_offset,
-                    "pointer_value": pointer_value,
-                    "string_pointer": string_pointer,
-                }
-            )
-
-        block = data[team_offset:team_offset + TEAM_BLOCK_LENGTH]
-        extra_strings = scan_for_extra_strings(data, team_offset, set(strings))
-        teams.append(
-            {
+        # The span stops before the yield so the consumer's time is not counted.
+        with profiling.span("dump.decode_team"):
+            strings = []
+            pointers = []
+            for field_index in range(5):
+                pointer_offset = team_offset + field_index * 4
+                pointer_value = roster.read_u32(pointer_offset)
+                string_pointer = pointer_offset + pointer_value
+                string_value = read_dump_string(roster, string_pointer)
+                strings.append(string_value)
+                pointers.append(
+                    {
+                        "field_index": field_index,
+                        "pointer_offset": pointer_offset,
+                        "pointer_value": pointer_value,
+                        "string_pointer": string_pointer,
+                    }
+                )
+
+            extra_strings = scan_for_extra_strings(roster, team_offset, set(strings))
+            team = {
                 "index": team_index,
                 "offset": team_offset,
                 "offset_hex": hex(team_offset),
@@ -115,27 +106,32 @@ def parse_teams(data, team_offsets):
                 "nickname": strings[3],
                 "mascot": strings[4],
                 "pointers": pointers,
-                "block_hex": chunked_hex(block),
-                "extra_strings": extra_strings,
             }
-        )
-    return teams
+            if include_block_hex:
+                team["block_hex"] = chunked_hex(roster.block(team_offset, TEAM_BLOCK_LENGTH))
+            team["extra_strings"] = extra_strings
+        yield team
+
 
+def parse_teams(roster, team_offsets, include_block_hex=True):
+    return list(iter_teams(roster, team_offsets, include_block_hex))
 
-def parse_conferences(data):
+
+def parse_conferences(roster, layout=DEFAULT_LAYOUT):
     conferences = []
-    for offset in range(CONFERENCE_INFO_TABLE_START, CONFERENCE_INFO_TABLE_END, CONFERENCE_BLOCK_LENGTH):
-        pointer = read_be_u32(data, offset)
-        conference_name_offset = offset + pointer
-        conference_name = read_utf16le_string(data, conference_name_offset)
-        conferences.append(
-            {
-                "offset": offset,
-                "offset_hex": hex(offset),
-                "name": conference_name,
-                "name_pointer": conference_name_offset,
-            }
-        )
+    table = open_table("conferences", roster.buffer, layout)
+    for conference in table:
+        entry = {
+            "offset": conference.offset,
+            "offset_hex": hex(conference.offset),
+            "name": conference.name,
+            "name_pointer": table.pointer(conference.index, "name"),
+            "abbr": conference.abbr,
+            "abbr_pointer": table.pointer(conference.index, "abbr"),
+        }
+        entry.update((field, getattr(conference, field)) for field in CONFERENCE_VALUE_FIELDS)
+        conferences.append(entry)
+    profiling.count("strings.decoded", 2 * len(table))
     return conferences
 
 
@@ -144,62 +140,165 @@ def write_csv(path, header, rows):
         file.write(",".join(header))
         file.write("\n")
         for row in rows:
-            escaped = [f"\"{str(value).replace('\"', '\"\"')}\"" for value in row]
+            escaped = ['"' + str(value).replace('"', '""') + '"' for value in row]
             file.write(",".join(escaped))
             file.write("\n")
 
 
+def write_json_stream(file, file_length, teams, conferences, compact=False):
+    # Writes the same document json.dump(payload, indent=2) would (or its
+    # compact form) while holding only one team in memory at a time.
+    pad = "" if compact else "  "
+    newline = "" if compact else "\n"
+    colon = ":" if compact else ": "
+
+    def encode(value, depth):
+        if compact:
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n" + pad * depth)
+
+    file.write("{" + newline + pad + '"file_length"' + colon + str(file_length) + ",")
+    file.write(newline + pad + '"teams"' + colon + "[")
+    count = 0
+    for team in teams:
+        file.write(("," if count else "") + newline + pad * 2 + encode(team, 2))
+        count += 1
+    file.write((newline + pad if count else "") + "],")
+    file.write(newline + pad + '"conferences"' + colon + encode(conferences, 1) + newline + "}")
+
+
+def write_ndjson(file, file_length, teams, conferences):
+    # One record per line, tagged with its kind, written as it is parsed.
+    def write_record(record):
+        file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        file.write("\n")
+
+    write_record({"record": "file", "file_length": file_length})
+    for team in teams:
+        write_record(dict(record="team", **team))
+    for conference in conferences:
+        write_record(dict(record="conference", **conference))
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Decode College Hoops 2k8 roster USERDATA into structured JSON/CSV exports."
     )
     parser.add_argument("--input", default=USERDATA_FILE, help="Path to USERDATA roster file.")
-    parser.add_argument("--team-offsets", default=TEAM_OFFSETS_FILE, help="Path to team_offsets.txt.")
+    parser.add_argument(
+        "--team-offsets", help="Path to a team_offsets.txt listing the teams to dump (default: every team found)."
+    )
     parser.add_argument("--json-out", default="dump.json", help="Path for JSON output.")
     parser.add_argument("--teams-csv", default="teams.csv", help="Path for team CSV output.")
     parser.add_argument("--conferences-csv", default="conferences.csv", help="Path for conference CSV output.")
-    args = parser.parse_args()
-
-    with open(args.input, "rb") as file:
-        data = file.read()
-
-    team_offsets = load_team_offsets(args.team_offsets)
-    teams = parse_teams(data, team_offsets)
-    conferences = parse_conferences(data)
-
-    payload = {
-        "file_length": len(data),
-        "teams": teams,
-        "conferences": conferences,
-    }
-
-    with open(args.json_out, "w", encoding="utf-8") as file:
-        json.dump(payload, file, indent=2, ensure_ascii=False)
-
-    write_csv(
-        args.teams_csv,
-        ["index", "offset_hex", "team_name", "team_abbr", "team_name_2", "nickname", "mascot"],
-        [
-            [
-                team["index"],
-                team["offset_hex"],
-                team["team_name"],
-                team["team_abbr"],
-                team["team_name_2"],
-                team["nickname"],
-                team["mascot"],
-            ]
-            for team in teams
-        ],
+    parser.add_argument(
+        "--format", choices=["json", "ndjson"], default="json", help="JSON document or one record per line."
     )
+    parser.add_argument("--compact", action="store_true", help="Write JSON without indentation.")
+    parser.add_argument("--no-block-hex", action="store_true", help="Leave out the per-team block hex.")
+    parser.add_argument("--no-cache", action="store_true", help="Decode the roster even if it is in the parse cache.")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.run(args.profile, write_dump, args)
+
+
+def cached_teams(roster, lines, include_block_hex=True):
+    # Teams from the compact lines kept in the parse cache, one at a time.
+    # The block hex is not cached; it is read back from the roster.
+    for line in lines.split(b"\n"):
+        team = json.loads(line)
+        if include_block_hex:
+            extra_strings = team.pop("extra_strings")
+            team["block_hex"] = chunked_hex(roster.block(team["offset"], TEAM_BLOCK_LENGTH))
+            team["extra_strings"] = extra_strings
+        yield team
+
+
+def write_dump(args):
+    cache = None if args.no_cache else open_cache()
+    try:
+        dump_roster(args, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def dump_roster(args, cache):
+    # Kept for the CSV written after the JSON
+    team_rows = TeamRecords()
+    # Decoded teams are kept for the cache only when they are not cached yet,
+    # as one compact JSON line each without the block hex
+    decoded = None
+
+    def teams(team_source):
+        for team in team_source:
+            if decoded is not None:
+                decoded.append(
+                    json.dumps(
+                        {key: value for key, value in team.items() if key != "block_hex"},
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                    ).encode("utf-8")
+                )
+            team_rows.append(
+                team["offset"],
+                (team["team_name"], team["team_abbr"], team["team_name_2"], team["nickname"], team["mascot"]),
+            )
+            yield team
+
+    with RosterFile(args.input) as roster, open(args.json_out, "w", encoding="utf-8") as file:
+        digest = cached = None
+        if cache is not None:
+            with profiling.span("dump.hash"):
+                digest = file_digest(roster.buffer)
+        with profiling.span("dump.detect_layout"):
+            layout = detect_layout(roster.buffer, cache, digest)
+        if args.team_offsets:
+            team_offsets = load_team_offsets(args.team_offsets)
+        else:
+            team_offsets = layout.team_offsets()
+        params = params_key(list(team_offsets))
+        if cache is not None:
+            with profiling.span("dump.cache_load"):
+                cached = cache.get(digest, "dump", params)
+        if cached is not None:
+            profiling.count("cache.hits")
+            lines, conferences = cached
+            team_source = cached_teams(roster, lines, include_block_hex=not args.no_block_hex) if lines else []
+        else:
+            with profiling.span("dump.conferences"):
+                conferences = parse_conferences(roster, layout)
+            team_source = iter_teams(roster, team_offsets, include_block_hex=not args.no_block_hex)
+            if cache is not None:
+                decoded = []
+        # Includes decoding the teams, which are parsed as they are written
+        with profiling.span("dump.write_json"):
+            if args.format == "ndjson":
+                write_ndjson(file, len(roster), teams(team_source), conferences)
+            else:
+                write_json_stream(file, len(roster), teams(team_source), conferences, compact=args.compact)
+        if decoded is not None:
+            with profiling.span("dump.cache_store"):
+                cache.put(digest, "dump", (b"\n".join(decoded), conferences), params)
+
+    with profiling.span("dump.write_csv"):
+        write_csv(
+            args.teams_csv,
+            ["index", "offset_hex", "team_name", "team_abbr", "team_name_2", "nickname", "mascot"],
+            (
+                [index, hex(offset)] + list(values)
+                for index, (offset, values) in enumerate(zip(team_rows.offsets, team_rows))
+            ),
+        )
 
-    write_csv(
-        args.conferences_csv,
-        ["offset_hex", "name"],
-        [[conference["offset_hex"], conference["name"]] for conference in conferences],
-    )
+        conference_columns = ["offset_hex", "name", "abbr"] + list(CONFERENCE_VALUE_FIELDS)
+        write_csv(
+            args.conferences_csv,
+            conference_columns,
+            [[conference[column] for column in conference_columns] for conference in conferences],
+        )
 
-    print(f"Wrote {args.json_out} with {len(teams)} teams and {len(conferences)} conferences.")
+    print(f"Wrote {args.json_out} with {len(team_rows)} teams and {len(conferences)} conferences.")
     print(f"Wrote {args.teams_csv} and {args.conferences_csv}.")
 
 
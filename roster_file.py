@@ -0,0 +1,198 @@
+import mmap
+import os
+import struct
+
+TEAM_INFO_START = 0x1D8614
+TEAM_INFO_END = 0x224860
+TEAM_BLOCK_LENGTH = 0x2C0
+TEAM_FIELD_COUNT = 5
+STRING_POOL_START = 0x362CF8
+DATA_OFFSET = 0x3CBFE0
+
+CONFERENCE_INFO_TABLE_START = 0x34597C
+CONFERENCE_INFO_TABLE_END = 0x361198
+CONFERENCE_BLOCK_LENGTH = 0xB94
+
+BE_U32 = struct.Struct(">I")
+TEAM_POINTERS = struct.Struct(">%dI" % TEAM_FIELD_COUNT)
+
+
+def read_be_u32(data, offset):
+    return BE_U32.unpack_from(data, offset)[0]
+
+
+def utf16le_string_end(data, pointer, max_bytes=None):
+    # Offset of the 2-byte aligned null terminator, or of the last whole
+    # character before the limit when the string is unterminated.
+    limit = len(data) if max_bytes is None else min(len(data), pointer + max_bytes)
+    if pointer >= limit:
+        return pointer
+    end = data.find(b"\x00\x00", pointer, limit)
+    while end != -1 and (end - pointer) % 2:
+        end = data.find(b"\x00\x00", end + 1, limit)
+    if end == -1:
+        end = pointer + (limit - pointer) // 2 * 2
+    return end
+
+
+def utf16le_unit_mask(data, start, stop):
+    # One byte per 2-byte unit of data[start:stop], zero exactly where the
+    # unit is a null character.
+    units = (stop - start) // 2
+    stop = start + units * 2
+    low = int.from_bytes(data[start:stop:2], "big")
+    high = int.from_bytes(data[start + 1:stop:2], "big")
+    return (low | high).to_bytes(units, "big")
+
+
+def read_utf16le_string(data, pointer, max_bytes=256, errors="replace"):
+    end = utf16le_string_end(data, pointer, max_bytes)
+    return str(data[pointer:end], "utf-16-le", errors)
+
+
+def team_offsets(start=TEAM_INFO_START, end=TEAM_INFO_END):
+    team_count = (end - start) // TEAM_BLOCK_LENGTH
+    return range(start, start + team_count * TEAM_BLOCK_LENGTH, TEAM_BLOCK_LENGTH)
+
+
+def is_printable_string(value):
+    if not value:
+        return False
+    printable = sum(1 for ch in value if ch.isprintable())
+    return printable / len(value) >= 0.85
+
+
+class RosterFile:
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self.dirty = []
+        self._open(path)
+
+    def _open(self, path):
+        self._file = open(path, "rb")
+        try:
+            # Writable rosters map copy-on-write: edits stay in memory until save().
+            self.buffer = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_COPY if self.writable else mmap.ACCESS_READ
+            )
+        except (OSError, ValueError):
+            self._file.close()
+            raise
+        self.view = memoryview(self.buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.view.release()
+        self.buffer.close()
+        self._file.close()
+
+    @property
+    def is_dirty(self):
+        return bool(self.dirty)
+
+    def dirty_ranges(self):
+        ranges = []
+        for start, end in sorted(self.dirty):
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return [(start, end) for start, end in ranges]
+
+    def save(self, path=None, atomic=False):
+        # Patches only the changed ranges into the file, or with atomic=True
+        # writes the whole image to a temporary file and renames it over the
+        # target. Saving under a new path is always atomic.
+        path = self.path if path is None else path
+        if atomic or os.path.abspath(path) != os.path.abspath(self.path):
+            self._replace(path)
+        else:
+            with open(path, "r+b") as file:
+                for start, end in self.dirty_ranges():
+                    file.seek(start)
+                    file.write(self.view[start:end])
+                file.flush()
+                os.fsync(file.fileno())
+        self.path = path
+        self.dirty = []
+
+    def _replace(self, path):
+        # Only atomic saves need these, so plain reads don't import them
+        import shutil
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".roster-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(self.view)
+                file.flush()
+                os.fsync(file.fileno())
+            if os.path.exists(path):
+                shutil.copymode(path, temp_path)
+            # Windows refuses to rename over a file that is open or mapped, so
+            # the roster is closed for the rename and mapped again from the
+            # saved file.
+            self.close()
+            try:
+                os.replace(temp_path, path)
+            except BaseException:
+                # Reopen the old file and bring the unsaved edits back from
+                # the temporary copy.
+                self._open(self.path)
+                with open(temp_path, "rb") as file:
+                    for start, end in self.dirty_ranges():
+                        file.seek(start)
+                        file.readinto(self.view[start:end])
+                raise
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._open(path)
+
+    @property
+    def file_length(self):
+        return self.read_u32(0)
+
+    def read_u32(self, offset):
+        return BE_U32.unpack_from(self.buffer, offset)[0]
+
+    def write_u32(self, offset, value):
+        BE_U32.pack_into(self.buffer, offset, value)
+        self.dirty.append((offset, offset + 4))
+
+    def write(self, offset, data):
+        self.buffer[offset:offset + len(data)] = data
+        self.dirty.append((offset, offset + len(data)))
+
+    def block(self, offset, length):
+        return self.view[offset:offset + length]
+
+    def read_string(self, pointer, max_bytes=None, errors="surrogatepass"):
+        end = utf16le_string_end(self.buffer, pointer, max_bytes)
+        return str(self.view[pointer:end], "utf-16-le", errors)
+
+    def team_offsets(self, start=TEAM_INFO_START, end=TEAM_INFO_END):
+        return team_offsets(start, end)
+
+    def team_string_pointers(self, team_offset):
+        # Each pointer is relative to its own 4-byte slot.
+        values = TEAM_POINTERS.unpack_from(self.buffer, team_offset)
+        return [team_offset + field_index * 4 + value for field_index, value in enumerate(values)]
+
+    def read_team(self, team_offset):
+        return tuple(self.read_string(pointer) for pointer in self.team_string_pointers(team_offset))
+
+    def read_teams(self):
+        return [self.read_team(team_offset) for team_offset in self.team_offsets()]
@@ -0,0 +1,164 @@
+import re
+from collections import namedtuple
+
+from conferences import conference_offsets
+from parse_cache import file_digest
+from roster_file import (
+    CONFERENCE_INFO_TABLE_END,
+    CONFERENCE_INFO_TABLE_START,
+    DATA_OFFSET,
+    STRING_POOL_START,
+    TEAM_BLOCK_LENGTH,
+    TEAM_FIELD_COUNT,
+    TEAM_INFO_START,
+    TEAM_POINTERS,
+    is_printable_string,
+    read_utf16le_string,
+    team_offsets,
+)
+
+# Fewer valid records in a row than this is not taken for the team table.
+MIN_TEAMS = 64
+
+ZERO_BYTES = bytes([1] + [0] * 255)
+NONZERO_BYTES = bytes([0] + [1] * 255)
+
+
+class RosterLayout(namedtuple("RosterLayout", "team_start team_count string_pool_start data_offset")):
+    __slots__ = ()
+
+    def team_offsets(self):
+        return range(self.team_start, self.team_start + self.team_count * TEAM_BLOCK_LENGTH, TEAM_BLOCK_LENGTH)
+
+    def conference_offsets(self):
+        # The conference table sits just before the string pool and moves with it.
+        shift = self.string_pool_start - STRING_POOL_START
+        return conference_offsets(CONFERENCE_INFO_TABLE_START + shift, CONFERENCE_INFO_TABLE_END + shift)
+
+
+DEFAULT_LAYOUT = RosterLayout(TEAM_INFO_START, len(team_offsets()), STRING_POOL_START, DATA_OFFSET)
+
+
+def string_targets(data, team_offset):
+    # Offsets of a team record's non-empty strings, or None unless every
+    # pointer lands on a printable string that starts right after a null
+    # unit. Empty strings may share another string's terminator, so they are
+    # only required to be in the file, and at least one must be non-empty.
+    if team_offset < 0 or team_offset + TEAM_POINTERS.size > len(data):
+        return None
+    targets = []
+    for field_index, value in enumerate(TEAM_POINTERS.unpack_from(data, team_offset)):
+        target = team_offset + field_index * 4 + value
+        if not value or not 2 <= target < len(data) - 1:
+            return None
+        if data[target:target + 2] != b"\x00\x00":
+            if data[target - 2:target] != b"\x00\x00" or not is_printable_string(read_utf16le_string(data, target)):
+                return None
+            targets.append(target)
+    return targets or None
+
+
+def pointer_mask(data, phase):
+    # One byte per big-endian u32 word starting at `phase`: 1 where the word
+    # is non-zero and small enough to point inside the file, 0 elsewhere.
+    words = (len(data) - phase) // 4
+    stop = phase + words * 4
+    high = data[phase:stop:4].translate(ZERO_BYTES)
+    limit = len(data) >> 16
+    second = data[phase + 1:stop:4].translate(bytes(int(byte <= limit) for byte in range(256)))
+    low = (
+        int.from_bytes(data[phase + 1:stop:4], "big")
+        | int.from_bytes(data[phase + 2:stop:4], "big")
+        | int.from_bytes(data[phase + 3:stop:4], "big")
+    )
+    nonzero = low.to_bytes(words, "big").translate(NONZERO_BYTES)
+    mask = int.from_bytes(high, "big") & int.from_bytes(second, "big") & int.from_bytes(nonzero, "big")
+    return mask, words
+
+
+def record_candidates(data, phase):
+    # Runs of record starts, one stride apart, whose five words all pass
+    # pointer_mask: yields (first offset, record count).
+    mask, words = pointer_mask(data, phase)
+    # Byte w of `records` is 1 when words w..w+4 all are
+    records = mask
+    for field_index in range(1, TEAM_FIELD_COUNT):
+        records &= mask << 8 * field_index
+    records = (records & ((1 << 8 * words) - 1)).to_bytes(words, "big")
+    stride = TEAM_BLOCK_LENGTH // 4
+    run = re.compile(b"\x01{%d,}" % MIN_TEAMS)
+    for residue in range(stride):
+        for match in run.finditer(records[residue::stride]):
+            yield phase + (residue + match.start() * stride) * 4, match.end() - match.start()
+
+
+def longest_valid_run(data, start, count):
+    # (first offset, record count, lowest string offset) of the longest
+    # stretch of records in the candidate that fully validate.
+    best = (start, 0, None)
+    run_start, run_count, lowest = start, 0, None
+    for team_offset in range(start, start + count * TEAM_BLOCK_LENGTH, TEAM_BLOCK_LENGTH):
+        targets = string_targets(data, team_offset)
+        if targets is None:
+            run_count = 0
+            continue
+        if run_count == 0:
+            run_start, lowest = team_offset, min(targets)
+        else:
+            lowest = min(lowest, min(targets))
+        run_count += 1
+        if run_count > best[1]:
+            best = (run_start, run_count, lowest)
+    return best
+
+
+def discover_layout(data):
+    # Every 4-byte phase is tried, in case a variant shifted the tables by a
+    # length that is not a multiple of four. The pool is assumed to have moved
+    # with the team table unless team strings sit before that; then it starts
+    # one byte before the lowest one, as in the known layout. The editor's
+    # data region keeps its place relative to the pool.
+    candidates = []
+    for phase in range(4):
+        candidates.extend(record_candidates(data, phase))
+    candidates.sort(key=lambda candidate: -candidate[1])
+    best = (0, 0, None)
+    for start, count in candidates:
+        if count <= best[1]:
+            break
+        run = longest_valid_run(data, start, count)
+        if run[1] > best[1]:
+            best = run
+    team_start, team_count, lowest_string = best
+    if team_count < MIN_TEAMS:
+        return None
+    string_pool_start = STRING_POOL_START + team_start - TEAM_INFO_START
+    if string_pool_start >= lowest_string:
+        string_pool_start = lowest_string - 1
+    return RosterLayout(team_start, team_count, string_pool_start, string_pool_start + DATA_OFFSET - STRING_POOL_START)
+
+
+def matches_default(data):
+    # Spot-checks the first, middle and last team at the known offsets.
+    offsets = DEFAULT_LAYOUT.team_offsets()
+    return len(data) >= DATA_OFFSET and all(
+        string_targets(data, offsets[index]) is not None for index in (0, len(offsets) // 2, -1)
+    )
+
+
+def detect_layout(data, cache=None, digest=None):
+    # The known offsets are used whenever they fit. Other files are searched,
+    # and with a ParseCache remembered by content digest.
+    if matches_default(data):
+        return DEFAULT_LAYOUT
+    if cache is not None:
+        digest = digest or file_digest(data)
+        cached = cache.get(digest, "layout")
+        if cached is not None:
+            return RosterLayout(*cached)
+    layout = discover_layout(data)
+    if layout is None:
+        raise ValueError("No team table found")
+    if cache is not None:
+        cache.put(digest, "layout", tuple(layout))
+    return layout
@@ -0,0 +1,232 @@
+import argparse
+import bisect
+import re
+import struct
+import sys
+import zlib
+
+from parse_cache import file_digest
+from roster_file import BE_U32, TEAM_FIELD_COUNT, RosterFile
+from roster_layout import detect_layout
+from roster_session import CONFERENCE_STRING_FIELDS
+
+MAGIC = b"CH2KDIFF"
+VERSION = 1
+BLOCK_SIZE = 4096
+# Changed bytes closer together than this are kept in one range.
+MERGE_GAP = 8
+CHANGED_BYTES = re.compile(rb"[^\x00]+")
+HEADER = struct.Struct(">8sBB")
+COUNT = struct.Struct(">I")
+POINTER = struct.Struct(">II")
+RANGE = struct.Struct(">II")
+
+
+class RosterPatch:
+    # Changes from one roster to another: pointer slots that were repointed,
+    # byte ranges in the string pool and data region, and any other ranges.
+    def __init__(self, base_digest, result_digest, pointers=(), strings=(), other=()):
+        self.base_digest = base_digest
+        self.result_digest = result_digest
+        self.pointers = list(pointers)
+        self.strings = list(strings)
+        self.other = list(other)
+
+    def to_bytes(self):
+        body = [COUNT.pack(len(self.pointers))]
+        body += [POINTER.pack(slot, value) for slot, value in self.pointers]
+        for ranges in (self.strings, self.other):
+            body.append(COUNT.pack(len(ranges)))
+            for offset, data in ranges:
+                body.append(RANGE.pack(offset, len(data)))
+                body.append(data)
+        digests = self.base_digest.encode("ascii") + b"\n" + self.result_digest.encode("ascii")
+        return (
+            HEADER.pack(MAGIC, VERSION, len(digests))
+            + digests
+            + zlib.compress(b"".join(body), 9)
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < HEADER.size:
+            raise ValueError("Not a roster patch")
+        magic, version, digests_length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a roster patch")
+        if version != VERSION:
+            raise ValueError("Unsupported roster patch version %d" % version)
+        digests = data[HEADER.size:HEADER.size + digests_length].decode("ascii")
+        base_digest, result_digest = digests.split("\n")
+        try:
+            body = zlib.decompress(data[HEADER.size + digests_length:])
+        except zlib.error as e:
+            raise ValueError("Corrupt roster patch: %s" % e)
+
+        position = 0
+
+        def read(unpacker):
+            nonlocal position
+            values = unpacker.unpack_from(body, position)
+            position += unpacker.size
+            return values
+
+        try:
+            (count,) = read(COUNT)
+            pointers = [read(POINTER) for _ in range(count)]
+            range_lists = []
+            for _ in range(2):
+                (count,) = read(COUNT)
+                ranges = []
+                for _ in range(count):
+                    offset, length = read(RANGE)
+                    ranges.append((offset, body[position:position + length]))
+                    position += length
+                range_lists.append(ranges)
+        except struct.error:
+            raise ValueError("Truncated roster patch")
+        return cls(base_digest, result_digest, pointers, *range_lists)
+
+    @property
+    def changed_bytes(self):
+        return 4 * len(self.pointers) + sum(len(data) for _, data in self.strings + self.other)
+
+
+def changed_blocks(base, target, block_size=BLOCK_SIZE):
+    # Offsets of the fixed-size blocks that differ. Equal 64 KiB spans are
+    # skipped before blocks are compared.
+    span = block_size * 16
+    blocks = []
+    for span_start in range(0, len(base), span):
+        span_end = span_start + span
+        if base[span_start:span_end] == target[span_start:span_end]:
+            continue
+        for start in range(span_start, min(span_end, len(base)), block_size):
+            if base[start:start + block_size] != target[start:start + block_size]:
+                blocks.append(start)
+    return blocks
+
+
+def changed_ranges(base, target, block_size=BLOCK_SIZE):
+    # Exact (start, end) ranges of differing bytes, found by XORing each
+    # changed block and merging ranges less than MERGE_GAP bytes apart.
+    ranges = []
+    for start in changed_blocks(base, target, block_size):
+        end = min(start + block_size, len(base))
+        difference = int.from_bytes(base[start:end], "big") ^ int.from_bytes(target[start:end], "big")
+        for match in CHANGED_BYTES.finditer(difference.to_bytes(end - start, "big")):
+            range_start, range_end = start + match.start(), start + match.end()
+            if ranges and range_start - ranges[-1][1] < MERGE_GAP:
+                ranges[-1][1] = range_end
+            else:
+                ranges.append([range_start, range_end])
+    return [(start, end) for start, end in ranges]
+
+
+def pointer_slots(layout):
+    # Sorted offsets of every team and conference string pointer.
+    slots = {
+        team_offset + field_index * 4
+        for team_offset in layout.team_offsets()
+        for field_index in range(TEAM_FIELD_COUNT)
+    }
+    slots.update(
+        conference_offset + field_index * 4
+        for conference_offset in layout.conference_offsets()
+        for field_index in range(CONFERENCE_STRING_FIELDS)
+    )
+    return sorted(slots)
+
+
+def diff_rosters(base, target):
+    if len(base) != len(target):
+        raise ValueError("Rosters differ in length (%d and %d bytes)" % (len(base), len(target)))
+    layout = detect_layout(base)
+    slots = pointer_slots(layout)
+    patch = RosterPatch(file_digest(base), file_digest(target))
+    for start, end in changed_ranges(base, target):
+        # Repointed slots are recorded as (slot, value); the bytes around
+        # them stay ranges.
+        position = start
+        for slot in slots[bisect.bisect_right(slots, start - 4):bisect.bisect_left(slots, end)]:
+            if slot > position:
+                patch.other.append((position, target[position:slot]))
+            patch.pointers.append((slot, BE_U32.unpack_from(target, slot)[0]))
+            position = slot + 4
+        if position < end:
+            ranges = patch.strings if position >= layout.string_pool_start else patch.other
+            ranges.append((position, target[position:end]))
+    return patch
+
+
+def apply_patch(roster, patch, check=True):
+    # Writes the patch into an open, writable RosterFile.
+    if check and file_digest(roster.buffer) != patch.base_digest:
+        raise ValueError("Roster does not match the patch's base file")
+    writes = [(slot, 4) for slot, _ in patch.pointers]
+    writes += [(offset, len(data)) for offset, data in patch.strings + patch.other]
+    if any(offset + length > len(roster) for offset, length in writes):
+        raise ValueError("Patch writes past the end of the roster")
+    for slot, value in patch.pointers:
+        roster.write_u32(slot, value)
+    for offset, data in patch.strings + patch.other:
+        roster.write(offset, data)
+    if check and file_digest(roster.buffer) != patch.result_digest:
+        raise ValueError("Patched roster does not match the expected result")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make and apply compact patches between USERDATA roster files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    diff_parser = commands.add_parser("diff", help="Write the changes from BASE to TARGET as a patch.")
+    diff_parser.add_argument("base", help="Original USERDATA.")
+    diff_parser.add_argument("target", help="Edited USERDATA.")
+    diff_parser.add_argument("-o", "--output", required=True, help="Patch file to write.")
+    apply_parser = commands.add_parser("apply", help="Apply PATCH to BASE.")
+    apply_parser.add_argument("base", help="USERDATA the patch was made from.")
+    apply_parser.add_argument("patch", help="Patch file.")
+    apply_parser.add_argument("-o", "--output", help="Write the result here instead of patching BASE in place.")
+    apply_parser.add_argument(
+        "--force", action="store_true", help="Apply even if BASE is not the file the patch was made from."
+    )
+    apply_parser.add_argument(
+        "--safe", action="store_true", help="Write a temporary copy and rename it into place."
+    )
+    info_parser = commands.add_parser("info", help="Describe a patch.")
+    info_parser.add_argument("patch", help="Patch file.")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "diff":
+            with RosterFile(args.base) as base, RosterFile(args.target) as target:
+                patch = diff_rosters(base.buffer, target.buffer)
+            data = patch.to_bytes()
+            with open(args.output, "wb") as file:
+                file.write(data)
+            print(
+                f"{args.output}: {len(patch.pointers)} pointer(s), {len(patch.strings)} string range(s), "
+                f"{len(patch.other)} other range(s), {len(data)} bytes"
+            )
+        elif args.command == "apply":
+            with open(args.patch, "rb") as file:
+                patch = RosterPatch.from_bytes(file.read())
+            with RosterFile(args.base, writable=True) as roster:
+                apply_patch(roster, patch, check=not args.force)
+                roster.save(args.output, atomic=args.safe)
+            print(f"{args.output or args.base}: {patch.changed_bytes} byte(s) patched")
+        else:
+            with open(args.patch, "rb") as file:
+                patch = RosterPatch.from_bytes(file.read())
+            print(f"base:    {patch.base_digest}")
+            print(f"result:  {patch.result_digest}")
+            print(f"pointers: {len(patch.pointers)}")
+            print(f"strings:  {len(patch.strings)} range(s), {sum(len(data) for _, data in patch.strings)} bytes")
+            print(f"other:    {len(patch.other)} range(s), {sum(len(data) for _, data in patch.other)} bytes")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
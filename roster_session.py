@@ -0,0 +1,332 @@
+import csv
+import itertools
+import struct
+from collections import namedtuple
+
+import profiling
+from conferences import CONFERENCE_FIELDS, FIELD_STRUCTS
+from parse_cache import CACHE_PATH, file_digest, open_cache
+from roster_file import TEAM_FIELD_COUNT, RosterFile, utf16le_string_end
+from roster_layout import RosterLayout, detect_layout
+from string_pool import ReferenceIndex, StringAllocator, StringPoolIndex
+from team_records import read_team_records
+
+TEAM_FIELDS = ["team_name", "team_abbr", "team_name_2", "nickname", "mascot"]
+# Conference fields 0 and 1 are the name and abbreviation string pointers
+CONFERENCE_STRING_FIELDS = 2
+
+
+class Compaction(namedtuple("Compaction", "live_strings merged_strings used_before used_after")):
+    __slots__ = ()
+
+    @property
+    def reclaimed(self):
+        return self.used_before - self.used_after
+
+
+def read_team_edits(file, team_offsets):
+    # Yields (team_index, [(field_index, value), ...]) per CSV row as it is
+    # read. Files in the teams.csv layout from roster_dump.py are matched by
+    # index, or by offset_hex without an index column, and fields whose
+    # column is missing are left alone. Files without that header (the
+    # editor's export) hold the five fields in order, one team per row.
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    if any(field in header for field in TEAM_FIELDS):
+        columns = [(header.index(field), field_index) for field_index, field in enumerate(TEAM_FIELDS) if field in header]
+        index_column = header.index("index") if "index" in header else None
+        offset_column = header.index("offset_hex") if "offset_hex" in header else None
+        team_indexes = {team_offset: team_index for team_index, team_offset in enumerate(team_offsets)}
+    else:
+        reader = itertools.chain([header], reader)
+        columns = [(field_index, field_index) for field_index in range(len(TEAM_FIELDS))]
+        index_column = offset_column = None
+
+    for row_number, row in enumerate(reader):
+        if not row:
+            continue
+        if index_column is not None and index_column < len(row) and row[index_column]:
+            team_index = int(row[index_column])
+        elif offset_column is not None and offset_column < len(row) and row[offset_column]:
+            team_index = team_indexes.get(int(row[offset_column], 16))
+            if team_index is None:
+                raise ValueError("No team at offset %s" % row[offset_column])
+        else:
+            team_index = row_number
+        yield team_index, [(field_index, row[column]) for column, field_index in columns if column < len(row)]
+
+
+class RosterSession:
+    # An open roster plus the string pool bookkeeping needed to edit team and
+    # conference data. Shared by the editor and the headless tools; imports no Qt.
+    #
+    # With a cache_path the layout, decoded records and string pool index of
+    # an unchanged file come from the parse cache instead of being rebuilt.
+    def __init__(self, path, cache_path=CACHE_PATH):
+        self.roster = RosterFile(path, writable=True)
+        # (teams, conferences) as decoded at open, until the first edit
+        self.records = None
+        try:
+            cache = open_cache(cache_path)
+            try:
+                self._index(cache)
+            finally:
+                if cache is not None:
+                    cache.close()
+        except BaseException:
+            self.roster.close()
+            raise
+        self.allocator = None
+
+    def _index(self, cache):
+        data = self.roster.buffer
+        digest = cached = None
+        if cache is not None:
+            with profiling.span("session.hash"):
+                digest = file_digest(data)
+            with profiling.span("session.cache_load"):
+                cached = cache.get(digest, "session")
+        if cached is None:
+            with profiling.span("session.detect_layout"):
+                self.layout = detect_layout(data, cache, digest)
+            with profiling.span("session.index_pool"):
+                self.string_index = StringPoolIndex(data, self.layout.string_pool_start)
+        else:
+            profiling.count("cache.hits")
+            layout, teams, conferences, string_offsets = cached
+            self.layout = RosterLayout(*layout)
+            self.string_index = StringPoolIndex(data, self.layout.string_pool_start, offsets=string_offsets)
+            self.records = teams, conferences
+        self.team_offsets = self.layout.team_offsets()
+        self.conference_offsets = self.layout.conference_offsets()
+        with profiling.span("session.index_references"):
+            self.references = ReferenceIndex(self.roster, self.team_offsets)
+            self.references.add_slots(
+                offset + field_index * 4
+                for offset in self.conference_offsets
+                for field_index in range(CONFERENCE_STRING_FIELDS)
+            )
+        if cache is not None and cached is None:
+            self.records = self.read_teams(), self.read_conferences()
+            with profiling.span("session.cache_store"):
+                cache.put(digest, "session", (tuple(self.layout),) + self.records + (self.string_index.offsets,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def path(self):
+        return self.roster.path
+
+    @property
+    def is_dirty(self):
+        return self.roster.is_dirty
+
+    def close(self):
+        self.roster.close()
+
+    def read_teams(self):
+        # A TeamRecords, read like a list of 5-tuples
+        if self.records is not None:
+            return self.records[0]
+        with profiling.span("session.read_teams"):
+            return read_team_records(self.roster, self.team_offsets)
+
+    def read_team_string(self, team_index, field_index):
+        return self.roster.read_string(self.references.target(self._slot(team_index, field_index)))
+
+    def _slot(self, team_index, field_index):
+        if not 0 <= field_index < TEAM_FIELD_COUNT:
+            raise IndexError("Field index %d out of range" % field_index)
+        return self.team_offsets[team_index] + field_index * 4
+
+    def read_conferences(self):
+        if self.records is not None:
+            return [list(row) for row in self.records[1]]
+        with profiling.span("session.read_conferences"):
+            conferences = [
+                [self.read_conference_field(conference_index, field_index) for field_index in range(len(CONFERENCE_FIELDS))]
+                for conference_index in range(len(self.conference_offsets))
+            ]
+        profiling.count("strings.decoded", len(conferences) * CONFERENCE_STRING_FIELDS)
+        return conferences
+
+    def read_conference_field(self, conference_index, field_index):
+        offset = self.conference_offsets[conference_index]
+        if field_index < CONFERENCE_STRING_FIELDS:
+            return self.roster.read_string(self.references.target(offset + field_index * 4))
+        field_offset, field_struct = FIELD_STRUCTS[CONFERENCE_FIELDS[field_index]]
+        return field_struct.unpack_from(self.roster.buffer, offset + field_offset)[0]
+
+    def set_conference_field(self, conference_index, field_index, value):
+        # Returns True when the roster changed.
+        offset = self.conference_offsets[conference_index]
+        if field_index < CONFERENCE_STRING_FIELDS:
+            return self._set_string(offset + field_index * 4, value)
+        field_offset, field_struct = FIELD_STRUCTS[CONFERENCE_FIELDS[field_index]]
+        try:
+            encoded = field_struct.pack(value)
+        except struct.error:
+            raise ValueError("%s out of range: %r" % (CONFERENCE_FIELDS[field_index], value))
+        offset += field_offset
+        if self.roster.buffer[offset:offset + len(encoded)] == encoded:
+            return False
+        self.records = None
+        self.roster.write(offset, encoded)
+        return True
+
+    def read_field(self, table, row, field_index):
+        if table == "conferences":
+            return self.read_conference_field(row, field_index)
+        return self.read_team_string(row, field_index)
+
+    def set_field(self, table, row, field_index, value):
+        if table == "conferences":
+            return self.set_conference_field(row, field_index, value)
+        return self.set_team_string(row, field_index, value)
+
+    def set_team_string(self, team_index, field_index, value):
+        # Returns True when the roster changed.
+        return self._set_string(self._slot(team_index, field_index), value)
+
+    def _set_string(self, pointer_offset, value):
+        roster = self.roster
+        data = roster.buffer
+        references = self.references
+        string_index = self.string_index
+        new_string = value.encode("utf-16-le", "surrogatepass") + b"\x00\x00"
+        old_string_pointer = references.target(pointer_offset)
+        old_string = data[old_string_pointer:utf16le_string_end(data, old_string_pointer) + 2]
+        if old_string == new_string:
+            return False
+        self.records = None
+
+        if self.allocator is None:
+            with profiling.span("pool.free_space_scan"):
+                self.allocator = StringAllocator(data, self.layout.data_offset, reserved=references.slots)
+
+        # Check if the new string already exists
+        new_string_pointer = string_index.find(new_string)
+        profiling.count("pool.lookups")
+        if new_string_pointer != -1:
+            profiling.count("strings.shared")
+            references.set_pointer(pointer_offset, new_string_pointer)
+            self._release_string(old_string_pointer, len(old_string))
+        # Overwrite in place only when no other slot points at the old string
+        elif len(new_string) == len(old_string) and references.refcount(old_string_pointer) == 1:
+            profiling.count("strings.in_place")
+            string_index.remove(old_string, old_string_pointer)
+            roster.write(old_string_pointer, new_string)
+            string_index.add(new_string, old_string_pointer)
+        else:
+            profiling.count("strings.relocated")
+            new_string_pointer = self.allocator.allocate(len(new_string))
+            roster.write(new_string_pointer, new_string)
+            references.set_pointer(pointer_offset, new_string_pointer)
+            string_index.add(new_string, new_string_pointer)
+            self._release_string(old_string_pointer, len(old_string))
+        return True
+
+    def apply_edits(self, values, report=None):
+        # values holds (table, row, field_index, value) edits, table being
+        # "teams" or "conferences". report(done, total) is called along the
+        # way and may return False to stop early; the edits applied so far
+        # are returned.
+        applied = []
+        with profiling.span("session.apply_edits"):
+            for done, edit in enumerate(values):
+                if report is not None and done % 32 == 0 and report(done, len(values)) is False:
+                    break
+                self.set_field(*edit)
+                applied.append(edit)
+        profiling.count("edits.applied", len(applied))
+        return applied
+
+    def _release_string(self, string_pointer, length):
+        # Only strings appended by the editor are reclaimed; the game's own pool
+        # may be referenced from tables that are not indexed.
+        if string_pointer >= self.layout.data_offset and self.references.refcount(string_pointer) == 0:
+            self.string_index.remove(self.roster.buffer[string_pointer:string_pointer + length], string_pointer)
+            self.roster.write(string_pointer, bytes(length))
+            self.allocator.release(string_pointer, length)
+
+    def compact_strings(self):
+        # Packs the strings the editor has written past data_offset into one
+        # run from its start, dropping orphans and merging identical strings
+        # (into the game's copy when the pool has one), then repoints every
+        # indexed slot. The game's pool is left where it is; tables that are
+        # not indexed may point into it.
+        roster = self.roster
+        data = roster.buffer
+        data_offset = self.layout.data_offset
+        with profiling.span("session.compact"):
+            # Up to the terminator of the last non-empty string
+            used_before = len(data[data_offset:].rstrip(b"\x00"))
+            if used_before:
+                used_before = min(used_before + used_before % 2 + 2, len(data) - data_offset)
+            # Slots are taken up front; a moved string can land on the old
+            # offset of one that has not moved yet.
+            slots = {
+                target: list(target_slots)
+                for target, target_slots in self.references.slots.items()
+                if target >= data_offset
+            }
+            targets = sorted(slots)
+            strings = {}
+            for target in targets:
+                end = utf16le_string_end(data, target) + 2
+                if end > len(data):
+                    raise ValueError("Unterminated string at 0x%X" % target)
+                strings[target] = data[target:end]
+
+            # Lowest offset first, so the packed strings keep their order
+            moves = {}
+            packed = {}
+            cursor = data_offset
+            for target in targets:
+                encoded = strings[target]
+                offset = packed.get(encoded)
+                if offset is None:
+                    offset = self.string_index.find(encoded)
+                    if offset == -1 or offset >= data_offset:
+                        offset = packed[encoded] = cursor
+                        cursor += len(encoded)
+                moves[target] = offset
+            used_after = cursor - data_offset
+            if cursor > len(data):
+                raise ValueError("Strings do not fit after 0x%X" % data_offset)
+
+            self.string_index.offsets = {
+                encoded: offset for encoded, offset in self.string_index.offsets.items() if offset < data_offset
+            }
+            region = b"".join(packed) + bytes(max(used_before - used_after, 0))
+            if data[data_offset:data_offset + len(region)] != region:
+                roster.write(data_offset, region)
+            for encoded, offset in packed.items():
+                self.string_index.add(encoded, offset)
+            for target, offset in moves.items():
+                if offset != target:
+                    for slot in slots[target]:
+                        self.references.set_pointer(slot, offset)
+            self.allocator = None
+        compaction = Compaction(len(targets), len(targets) - len(packed), used_before, used_after)
+        profiling.count("compact.bytes_reclaimed", compaction.reclaimed)
+        profiling.count("compact.strings_merged", compaction.merged_strings)
+        return compaction
+
+    def save(self, path=None, atomic=False):
+        if profiling.enabled:
+            profiling.count("save.bytes_patched", sum(end - start for start, end in self.roster.dirty_ranges()))
+        try:
+            with profiling.span("session.save"):
+                self.roster.save(path, atomic=atomic)
+        finally:
+            # An atomic save maps the roster afresh, even when it fails.
+            self.string_index.data = self.roster.buffer
+        # Free space is rescanned for the next batch of edits.
+        self.allocator = None
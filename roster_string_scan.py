@@ -1,22 +1,33 @@
 import argparse
 import json
+import os
+import re
 
+import profiling
+from parse_cache import file_digest, open_cache, params_key
+from roster_file import RosterFile, utf16le_unit_mask
 
-def read_utf16le_string(data, pointer, max_bytes=256):
-    output = bytearray()
-    while pointer + 2 <= len(data) and len(output) < max_bytes:
-        if data[pointer:pointer + 2] == b"\x00\x00":
-            break
-        output.extend(data[pointer:pointer + 2])
-        pointer += 2
-    return output.decode("utf-16-le", errors="replace")
 
-
-def is_printable_string(value):
-    if not value:
-        return False
-    printable = sum(1 for ch in value if ch.isprintable())
-    return printable / len(value) >= 0.85
+def load_dump_payload(path):
+    # Accepts the JSON document or the NDJSON records roster_dump.py writes.
+    with open(path, "r", encoding="utf-8") as file:
+        text = file.read()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        payload = {"teams": [], "conferences": []}
+        for line in text.split("\n"):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop("record", None)
+            if kind == "team":
+                payload["teams"].append(record)
+            elif kind == "conference":
+                payload["conferences"].append(record)
+            elif kind == "file":
+                payload.update(record)
+        return payload
 
 
 def load_known_strings(dump_payload):
@@ -43,74 +54,233 @@ def load_known_strings(dump_payload):
     return known
 
 
-def scan_for_strings(data, known_strings, min_length, max_length):
+def find_string_runs(data, min_length, max_length, start=0, stop=None):
+    # Each byte of the mask stands for one aligned 2-byte unit, so a regex over
+    # it finds every null-delimited run at once. Runs are cut at
+    # max_length + 1 units, as the per-offset reader used to.
+    #
+    # Only runs starting in [start, stop) are returned. The mask reaches one
+    # unit back and past stop far enough to see a run's cut end, so adjacent
+    # chunks report every run exactly once.
+    stop = len(data) if stop is None else min(stop, len(data))
+    max_units = max_length + 1
+    first = start - 2 if start > 0 else 0
+    last = min(len(data), stop + max(max_units, min_length) * 2)
+    with profiling.span("scan.find_runs"):
+        mask = utf16le_unit_mask(data, first, last)
+        run_pattern = re.compile(b"[^\\x00]{%d,}" % max(min_length, 1))
+        spans = list(map(re.Match.span, run_pattern.finditer(mask)))
+    profiling.count("scan.bytes", last - first)
+    if spans and first < start and spans[0][0] == 0:
+        del spans[0]
+    base = first // 2
+    while spans and (base + spans[-1][0]) * 2 >= stop:
+        spans.pop()
+    offsets = [(base + run_start) * 2 for run_start, _ in spans]
+    chunks = [
+        data[offset:offset + (end - run_start if end - run_start <= max_units else max_units) * 2]
+        for offset, (run_start, end) in zip(offsets, spans)
+    ]
+    profiling.count("scan.runs", len(chunks))
+    return offsets, chunks
+
+
+def decode_runs(chunks):
+    # Runs contain no null unit, so decoding them joined by one decodes each
+    # run exactly as it would be decoded alone.
+    return b"\x00\x00".join(chunks).decode("utf-16-le", errors="replace").split("\x00")
+
+
+def scan_for_strings(data, known_strings, min_length, max_length, start=0, stop=None):
     results = []
-    seen_offsets = set()
-    max_bytes = (max_length + 1) * 2
-    for offset in range(0, len(data) - 1, 2):
-        if data[offset:offset + 2] == b"\x00\x00":
-            continue
-        if offset > 0 and data[offset - 2:offset] != b"\x00\x00":
-            continue
-        if offset in seen_offsets:
-            continue
-        value = read_utf16le_string(data, offset, max_bytes=max_bytes)
-        if not (min_length <= len(value) <= max_length):
-            continue
-        if value in known_strings:
-            continue
-        if not is_printable_string(value):
-            continue
-        seen_offsets.add(offset)
-        results.append(
-            {
-                "offset": offset,
-                "offset_hex": hex(offset),
-                "length": len(value),
-                "value": value,
-            }
-        )
+    offsets, chunks = find_string_runs(data, min_length, max_length, start, stop)
+    with profiling.span("scan.decode"):
+        values = decode_runs(chunks)
+    profiling.count("strings.decoded", len(chunks))
+    with profiling.span("scan.filter"):
+        for offset, value in zip(offsets, values):
+            length = len(value)
+            if length < min_length or length > max_length or value in known_strings:
+                continue
+            # One unprintable character already fails the 85% rule below 7
+            # characters, so only longer values are counted.
+            if not value.isprintable() and (length < 7 or sum(map(str.isprintable, value)) / length < 0.85):
+                continue
+            results.append(
+                {
+                    "offset": offset,
+                    "offset_hex": hex(offset),
+                    "length": length,
+                    "value": value,
+                }
+            )
+    profiling.count("scan.strings", len(results))
     return results
 
 
-def write_csv(path, rows):
+def chunk_ranges(length, count):
+    size = max(-(-length // count), 2)
+    size += size % 2
+    return [(start, min(start + size, length)) for start in range(0, length, size)]
+
+
+_worker_known_strings = None
+
+
+def _init_worker(known_strings, profile=False):
+    global _worker_known_strings
+    _worker_known_strings = known_strings
+    if profile:
+        # Forked workers start with a copy of the parent's numbers.
+        profiling.reset()
+        profiling.enable()
+
+
+def _scan_chunk(path, min_length, max_length, start, stop):
+    # Returns the chunk's strings and, when profiling, what it recorded.
+    with RosterFile(path) as roster:
+        strings = scan_for_strings(roster.buffer, _worker_known_strings, min_length, max_length, start, stop)
+    return strings, profiling.take() if profiling.enabled else None
+
+
+def scan_files(paths, known_strings, min_length, max_length, jobs=1):
+    # Returns (path, file_length, strings) per input, in input order. With
+    # jobs > 1 every file is split into aligned chunks scanned in a process
+    # pool; chunk results are concatenated in chunk order, so the strings stay
+    # in offset order whatever order the workers finish in.
+    if jobs <= 1:
+        scans = []
+        for path in paths:
+            with RosterFile(path) as roster:
+                strings = scan_for_strings(roster.buffer, known_strings, min_length, max_length)
+                scans.append((path, len(roster), strings))
+        return scans
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    lengths = [os.path.getsize(path) for path in paths]
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(known_strings, profiling.enabled)
+    ) as pool:
+        futures = [
+            [
+                pool.submit(_scan_chunk, path, min_length, max_length, start, stop)
+                for start, stop in chunk_ranges(length, jobs)
+            ]
+            for path, length in zip(paths, lengths)
+        ]
+        scans = []
+        for path, length, file_futures in zip(paths, lengths, futures):
+            strings = []
+            for future in file_futures:
+                rows, recorded = future.result()
+                strings.extend(rows)
+                if recorded is not None:
+                    # Worker time adds up across processes, so it can exceed the wall time.
+                    profiling.merge(recorded)
+            scans.append((path, length, strings))
+        return scans
+
+
+def scan_with_cache(paths, dump_path, min_length, max_length, jobs, cache):
+    # Like scan_files, but files already scanned against the same dump and
+    # limits come from the parse cache, and the dump is only parsed when some
+    # file was not.
+    with profiling.span("scan.hash"):
+        with open(dump_path, "rb") as file:
+            params = params_key(file_digest(file.read()), min_length, max_length)
+        digests = []
+        for path in paths:
+            with RosterFile(path) as roster:
+                digests.append(file_digest(roster.buffer))
+
+    scans = [None] * len(paths)
+    missing = []
+    for index, (path, digest) in enumerate(zip(paths, digests)):
+        cached = cache.get(digest, "scan", params)
+        if cached is None:
+            missing.append(index)
+        else:
+            profiling.count("cache.hits")
+            scans[index] = (path,) + cached
+    if missing:
+        with profiling.span("scan.load_dump"):
+            known_strings = load_known_strings(load_dump_payload(dump_path))
+        with profiling.span("scan.files"):
+            scanned = scan_files([paths[index] for index in missing], known_strings, min_length, max_length, jobs)
+        for index, scan in zip(missing, scanned):
+            scans[index] = scan
+            cache.put(digests[index], "scan", scan[1:], params)
+    return scans
+
+
+def write_csv(path, scans):
+    # A single input keeps the original layout; several inputs get a leading
+    # input column.
+    with_input = len(scans) > 1
     with open(path, "w", encoding="utf-8") as file:
-        file.write("offset_hex,length,value\n")
-        for row in rows:
-            value = str(row["value"]).replace("\"", "\"\"")
-            file.write(f"\"{row['offset_hex']}\",{row['length']},\"{value}\"\n")
+        file.write("input,offset_hex,length,value\n" if with_input else "offset_hex,length,value\n")
+        for input_path, _, rows in scans:
+            prefix = "\"" + input_path.replace("\"", "\"\"") + "\"," if with_input else ""
+            for row in rows:
+                value = str(row["value"]).replace("\"", "\"\"")
+                file.write(prefix + f"\"{row['offset_hex']}\",{row['length']},\"{value}\"\n")
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Scan USERDATA for UTF-16LE strings not already captured in dump.json."
     )
-    parser.add_argument("--input", default="USERDATA", help="Path to USERDATA roster file.")
+    parser.add_argument(
+        "--input", nargs="+", default=["USERDATA"], help="Path to one or more USERDATA roster files."
+    )
     parser.add_argument("--dump-json", default="dump.json", help="Path to dump.json from roster_dump.py.")
     parser.add_argument("--json-out", default="roster_strings.json", help="Path for JSON output.")
     parser.add_argument("--csv-out", default="roster_strings.csv", help="Path for CSV output.")
     parser.add_argument("--min-length", type=int, default=2, help="Minimum string length to include.")
     parser.add_argument("--max-length", type=int, default=64, help="Maximum string length to include.")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Worker processes to scan with (0 uses every CPU)."
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Scan even if the results are in the parse cache.")
+    profiling.add_argument(parser)
     args = parser.parse_args()
+    profiling.run(args.profile, write_scan, args)
 
-    with open(args.dump_json, "r", encoding="utf-8") as file:
-        dump_payload = json.load(file)
-
-    with open(args.input, "rb") as file:
-        data = file.read()
 
-    known_strings = load_known_strings(dump_payload)
-    strings = scan_for_strings(data, known_strings, args.min_length, args.max_length)
+def write_scan(args):
+    jobs = args.jobs or os.cpu_count() or 1
+    cache = None if args.no_cache else open_cache()
+    if cache is None:
+        with profiling.span("scan.load_dump"):
+            known_strings = load_known_strings(load_dump_payload(args.dump_json))
+        with profiling.span("scan.files"):
+            scans = scan_files(args.input, known_strings, args.min_length, args.max_length, jobs)
+    else:
+        try:
+            scans = scan_with_cache(args.input, args.dump_json, args.min_length, args.max_length, jobs, cache)
+        finally:
+            cache.close()
 
-    payload = {
-        "file_length": len(data),
-        "strings": strings,
-    }
+    if len(scans) == 1:
+        _, file_length, strings = scans[0]
+        payload = {
+            "file_length": file_length,
+            "strings": strings,
+        }
+    else:
+        payload = {
+            "files": [
+                {"input": path, "file_length": file_length, "strings": strings}
+                for path, file_length, strings in scans
+            ],
+        }
 
-    with open(args.json_out, "w", encoding="utf-8") as file:
-        json.dump(payload, file, indent=2, ensure_ascii=False)
+    with profiling.span("scan.write"):
+        with open(args.json_out, "w", encoding="utf-8") as file:
+            json.dump(payload, file, indent=2, ensure_ascii=False)
 
-    write_csv(args.csv_out, strings)
+        write_csv(args.csv_out, scans)
 
 
 if __name__ == "__main__":
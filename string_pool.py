@@ -0,0 +1,177 @@
+import bisect
+import re
+
+from roster_file import TEAM_FIELD_COUNT, utf16le_unit_mask
+
+NON_NULL_RUN = re.compile(rb"[^\x00]+\x00")
+EMPTY_STRING = b"\x00\x00"
+# Same threshold the editor has always used when hunting for free space.
+FREE_RUN = re.compile(rb"\x00{10,}")
+MIN_EXTENT = 4
+
+
+class StringPoolIndex:
+    def __init__(self, data, start, end=None, offsets=None):
+        self.data = data
+        self.start = start
+        # A saved offsets dict (e.g. from the parse cache) skips the scan.
+        if offsets is not None:
+            self.offsets = offsets
+            return
+        self.offsets = {}
+        end = len(data) if end is None else end
+        # The game's own strings sit at odd offsets while the editor appends
+        # at even ones, so both alignments are indexed.
+        for alignment_start in (start, start + 1):
+            mask = utf16le_unit_mask(data, alignment_start, end)
+            for match in NON_NULL_RUN.finditer(mask):
+                offset = alignment_start + match.start() * 2
+                self._insert(data[offset:alignment_start + match.end() * 2], offset)
+            first_null = mask.find(b"\x00")
+            if first_null != -1:
+                self._insert(EMPTY_STRING, alignment_start + first_null * 2)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _insert(self, encoded, offset):
+        current = self.offsets.get(encoded)
+        if current is None or offset < current:
+            self.offsets[encoded] = offset
+
+    def starts_string(self, offset):
+        # A string starts after a null unit or at the start of the pool (in
+        # either alignment); anything else is the tail of a longer string.
+        return offset < self.start + 2 or self.data[offset - 2:offset] == EMPTY_STRING
+
+    def find(self, encoded):
+        offset = self.offsets.get(encoded)
+        if offset is None:
+            return -1
+        # Empty strings may share any terminator.
+        if self.data[offset:offset + len(encoded)] != encoded or (
+            encoded != EMPTY_STRING and not self.starts_string(offset)
+        ):
+            # The bytes were overwritten after the index was built.
+            del self.offsets[encoded]
+            return -1
+        return offset
+
+    def add(self, encoded, offset):
+        if self.find(encoded) == -1:
+            self.offsets[encoded] = offset
+
+    def remove(self, encoded, offset):
+        # Before the string at offset is zeroed or overwritten.
+        if self.offsets.get(encoded) == offset:
+            del self.offsets[encoded]
+
+
+class ReferenceIndex:
+    def __init__(self, roster, team_offsets, field_count=TEAM_FIELD_COUNT):
+        self.roster = roster
+        self.targets = {}
+        self.slots = {}
+        for team_offset in team_offsets:
+            pointers = roster.team_string_pointers(team_offset)
+            for field_index in range(field_count):
+                self._link(team_offset + field_index * 4, pointers[field_index])
+
+    def add_slots(self, slots):
+        # Other tables whose pointers share the pool, e.g. conference names.
+        for slot in slots:
+            self._link(slot, slot + self.roster.read_u32(slot))
+
+    def _link(self, slot, string_offset):
+        self.targets[slot] = string_offset
+        self.slots.setdefault(string_offset, set()).add(slot)
+
+    def _unlink(self, slot):
+        string_offset = self.targets.pop(slot)
+        slots = self.slots[string_offset]
+        slots.discard(slot)
+        if not slots:
+            del self.slots[string_offset]
+        return string_offset
+
+    def target(self, slot):
+        return self.targets[slot]
+
+    def refcount(self, string_offset):
+        return len(self.slots.get(string_offset, ()))
+
+    def set_pointer(self, slot, string_offset):
+        # Pointers are stored relative to their own slot.
+        old_offset = self._unlink(slot)
+        self.roster.write_u32(slot, string_offset - slot)
+        self._link(slot, string_offset)
+        return old_offset
+
+
+class StringAllocator:
+    def __init__(self, data, start, end=None, reserved=()):
+        end = len(data) if end is None else end
+        self.start = start
+        self.extents = []
+        self.ends = {}
+        self.starts = {}
+        # Empty strings live inside zero runs, so referenced offsets split them.
+        reserved = sorted(offset for offset in reserved if start <= offset < end)
+        for match in FREE_RUN.finditer(data, start, end):
+            run_start, run_end = match.span()
+            if run_start > start:
+                # Keep the last high byte and the terminator of the string before the run.
+                run_start += 3
+            if run_end < end:
+                # Keep the first byte of whatever follows the run.
+                run_end -= 1
+            for offset in reserved[bisect.bisect_left(reserved, run_start):bisect.bisect_left(reserved, run_end)]:
+                self._add_run(run_start, offset)
+                run_start = offset + 2
+            self._add_run(run_start, run_end)
+
+    def __len__(self):
+        return len(self.extents)
+
+    @property
+    def free_bytes(self):
+        return sum(size for size, _ in self.extents)
+
+    def _add_run(self, run_start, run_end):
+        # Allocations keep the even alignment of the region start.
+        run_start += (run_start - self.start) % 2
+        run_end -= (run_end - self.start) % 2
+        if run_end - run_start >= MIN_EXTENT:
+            self._insert(run_start, run_end)
+
+    def _insert(self, start, end):
+        self.ends[start] = end
+        self.starts[end] = start
+        bisect.insort(self.extents, (end - start, start))
+
+    def _remove(self, start):
+        end = self.ends.pop(start)
+        del self.starts[end]
+        del self.extents[bisect.bisect_left(self.extents, (end - start, start))]
+        return end
+
+    def allocate(self, size):
+        # Best fit: the smallest extent that holds the string.
+        index = bisect.bisect_left(self.extents, (size, -1))
+        if index == len(self.extents):
+            raise ValueError("No free space left for a %d-byte string" % size)
+        start = self.extents[index][1]
+        end = self._remove(start)
+        if end - (start + size) >= MIN_EXTENT:
+            self._insert(start + size, end)
+        return start
+
+    def release(self, start, size):
+        end = start + size
+        if end in self.ends:
+            end = self._remove(end)
+        if start in self.starts:
+            previous = self.starts[start]
+            self._remove(previous)
+            start = previous
+        self._insert(start, end)
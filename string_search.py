@@ -0,0 +1,175 @@
+import argparse
+import sys
+import unicodedata
+
+# Substrings of this many characters are indexed; shorter queries are checked
+# against every entry.
+GRAM_LENGTH = 3
+
+
+def normalize(text):
+    # Case and accents are ignored: "Quinnipiac" matches "QUINNIPIAC" and
+    # "Québec" matches "quebec".
+    text = str(text)
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(character for character in text if not unicodedata.combining(character))
+
+
+def grams(text):
+    return {text[start:start + GRAM_LENGTH] for start in range(len(text) - GRAM_LENGTH + 1)}
+
+
+class SearchIndex:
+    # Normalized strings under hashable keys, e.g. ("teams", row, column) or
+    # ("offset", file_offset), with a posting set of entry ids per n-gram.
+    # Entries are added, changed and removed one at a time, so an edit only
+    # touches the grams of the old and new value.
+    def __init__(self):
+        self.ids = {}
+        self.keys = {}
+        self.values = {}
+        self.normalized = {}
+        self.postings = {}
+        self.next_id = 0
+        # The last query and its hits; a query that extends it only has to
+        # check those.
+        self.last_query = None
+        self.last_hits = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def value(self, key):
+        return self.values[self.ids[key]]
+
+    def add(self, key, value):
+        if key in self.ids:
+            self.remove(key)
+        entry = self.next_id
+        self.next_id += 1
+        text = normalize(value)
+        self.ids[key] = entry
+        self.keys[entry] = key
+        self.values[entry] = value
+        self.normalized[entry] = text
+        for gram in grams(text):
+            self.postings.setdefault(gram, set()).add(entry)
+        self.last_query = None
+
+    def update(self, key, value):
+        if key in self.ids and self.values[self.ids[key]] == value:
+            return
+        self.add(key, value)
+
+    def remove(self, key):
+        entry = self.ids.pop(key, None)
+        if entry is None:
+            return
+        for gram in grams(self.normalized[entry]):
+            posting = self.postings[gram]
+            posting.discard(entry)
+            if not posting:
+                del self.postings[gram]
+        del self.keys[entry], self.values[entry], self.normalized[entry]
+        self.last_query = None
+
+    def search(self, query):
+        # Keys of the entries that contain the query, in the order they were
+        # added.
+        query = normalize(query)
+        if self.last_query is not None and self.last_query in query:
+            candidates = self.last_hits
+        elif len(query) < GRAM_LENGTH:
+            candidates = self.normalized
+        else:
+            postings = sorted((self.postings.get(gram, ()) for gram in grams(query)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        hits = sorted(entry for entry in candidates if query in self.normalized[entry])
+        self.last_query, self.last_hits = query, hits
+        return [self.keys[entry] for entry in hits]
+
+
+TEAM_FIELDS = ("team_name", "team_abbr", "team_name_2", "nickname", "mascot")
+CONFERENCE_FIELDS = ("name", "abbr")
+
+
+def index_dump(index, payload):
+    # Team and conference strings keyed by (table, row, field index), and the
+    # extra strings found in team blocks keyed by (table, row, string offset).
+    for row, team in enumerate(payload.get("teams", [])):
+        for field_index, field in enumerate(TEAM_FIELDS):
+            if team.get(field):
+                index.add(("teams", row, field_index), team[field])
+        for extra in team.get("extra_strings", []):
+            index.add(("team_extras", row, extra["string_pointer"]), extra["value"])
+    for row, conference in enumerate(payload.get("conferences", [])):
+        for field_index, field in enumerate(CONFERENCE_FIELDS):
+            if conference.get(field):
+                index.add(("conferences", row, field_index), conference[field])
+
+
+def index_scan(index, payload):
+    # Strings from roster_string_scan.py keyed by ("offset", offset), or by
+    # ("offset", offset, input) for a multi-file scan.
+    files = payload.get("files") or [{"input": None, "strings": payload.get("strings", [])}]
+    for scan in files:
+        for row in scan["strings"]:
+            key = ("offset", row["offset"]) if scan["input"] is None else ("offset", row["offset"], scan["input"])
+            index.add(key, row["value"])
+
+
+def describe(key):
+    if key[0] == "teams":
+        return f"team {key[1]} {TEAM_FIELDS[key[2]]}"
+    if key[0] == "conferences":
+        return f"conference {key[1]} {CONFERENCE_FIELDS[key[2]]}"
+    if key[0] == "team_extras":
+        return f"team {key[1]} extra {hex(key[2])}"
+    if len(key) == 3:
+        return f"{key[2]} {hex(key[1])}"
+    return hex(key[1])
+
+
+def main():
+    from roster_string_scan import load_dump_payload
+
+    parser = argparse.ArgumentParser(
+        description="Search the strings in dump.json and roster_strings.json, ignoring case and accents."
+    )
+    parser.add_argument("queries", nargs="+", metavar="query", help="Text to look for anywhere in a string.")
+    parser.add_argument("--dump-json", default="dump.json", help="Path to dump.json from roster_dump.py.")
+    parser.add_argument(
+        "--strings-json", default="roster_strings.json", help="Path to roster_strings.json from roster_string_scan.py."
+    )
+    parser.add_argument("--limit", type=int, default=50, help="Most hits to print (0 prints all).")
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    loaded = False
+    for path, add in ((args.dump_json, index_dump), (args.strings_json, index_scan)):
+        try:
+            add(index, load_dump_payload(path))
+            loaded = True
+        except FileNotFoundError:
+            print(f"Skipping {path}: not found", file=sys.stderr)
+    if not loaded:
+        return 1
+
+    # The index is built once for every query given
+    for query in args.queries:
+        hits = index.search(query)
+        if len(args.queries) > 1:
+            print(f"{query}:")
+        for key in hits[:args.limit or None]:
+            print(f"{describe(key):<40} {index.value(key)}")
+        print(f"{len(hits)} hit(s) for {query!r} in {len(index)} strings", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+from array import array
+
+import profiling
+from roster_file import TEAM_FIELD_COUNT, TEAM_POINTERS
+
+
+class StringTable:
+    # Each distinct string is stored once and referred to by its index.
+    # Records get a table of their own unless one is passed in, so their
+    # strings are freed with them. Rosters held open side by side (variants
+    # of one league, say) can share a table to keep a single copy of the
+    # names they have in common.
+    __slots__ = ("values", "ids")
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return string_id
+
+
+class TeamRecords:
+    # Teams as parallel arrays: the block offset of each team and, per
+    # field, the StringTable index of its value. Reads as a sequence of
+    # 5-tuples, built on access.
+    __slots__ = ("offsets", "columns", "strings")
+
+    def __init__(self, strings=None):
+        self.offsets = array("I")
+        self.columns = tuple(array("I") for _ in range(TEAM_FIELD_COUNT))
+        self.strings = StringTable() if strings is None else strings
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[row] for row in range(*index.indices(len(self)))]
+        values = self.strings.values
+        return tuple(values[column[index]] for column in self.columns)
+
+    def __iter__(self):
+        values = self.strings.values
+        return (tuple(values[string_id] for string_id in ids) for ids in zip(*self.columns))
+
+    def __eq__(self, other):
+        # Equal to any sequence of the same teams, like the lists of tuples
+        # read_teams() used to return.
+        try:
+            return len(self) == len(other) and all(row == other_row for row, other_row in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __getstate__(self):
+        # Pickled as plain strings; pickle writes each distinct one once.
+        return list(self.offsets), [self.column(field_index) for field_index in range(TEAM_FIELD_COUNT)]
+
+    def __setstate__(self, state):
+        offsets, columns = state
+        self.offsets = array("I", offsets)
+        self.strings = StringTable()
+        self.columns = tuple(array("I", map(self.strings.intern, column)) for column in columns)
+
+    def append(self, offset, values):
+        self.offsets.append(offset)
+        for column, value in zip(self.columns, values):
+            column.append(self.strings.intern(value))
+
+    def value(self, index, field_index):
+        return self.strings.values[self.columns[field_index][index]]
+
+    def column(self, field_index):
+        values = self.strings.values
+        return [values[string_id] for string_id in self.columns[field_index]]
+
+
+def read_team_records(roster, team_offsets, strings=None):
+    # Decodes each string once per pointer target, however many fields
+    # share it.
+    records = TeamRecords(strings)
+    intern = records.strings.intern
+    decoded = {}
+    unpack_from = TEAM_POINTERS.unpack_from
+    for team_offset in team_offsets:
+        records.offsets.append(team_offset)
+        for field_index, value in enumerate(unpack_from(roster.buffer, team_offset)):
+            pointer = team_offset + field_index * 4 + value
+            string_id = decoded.get(pointer)
+            if string_id is None:
+                string_id = decoded[pointer] = intern(roster.read_string(pointer))
+            records.columns[field_index].append(string_id)
+    profiling.count("strings.decoded", len(decoded))
+    return records
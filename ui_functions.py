@@ -1,18 +1,177 @@
-import sys
-import struct
-import os
-from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QTableWidget,
-                             QTableWidgetItem, QMenuBar, QMenu, QAction,
-                             QFileDialog, QMessageBox, QLabel, QUndoStack, QUndoCommand)
-from PyQt5.QtCore import Qt
-import chardet
-import csv
-
-class CustomTableWidget(QTableWidget):
+from PyQt5.QtWidgets import QTableView, QHeaderView, QMenu, QUndoCommand
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, QSortFilterProxyModel, pyqtSignal
+from array import array
+
+def bounded_int(maximum):
+    def convert(value):
+        value = int(value)
+        if not 0 <= value <= maximum:
+            raise ValueError("%d is outside 0-%d" % (value, maximum))
+        return value
+    return convert
+
+class RosterTableModel(QAbstractTableModel):
+    def __init__(self, headers, parent=None, types=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        # One converter per column; edits it rejects are dropped
+        self.types = list(types) if types else [str] * len(self.headers)
+        self.columns = [[] for _ in self.headers]
+        self.original = [[] for _ in self.headers]
+        self.dirty = set()
+        self.undo_stack = None
+
+    def load(self, rows):
+        # Values live in one list per column and the view is reset once.
+        self.beginResetModel()
+        self.columns = [[row[col] if col < len(row) else "" for row in rows] for col in range(len(self.headers))]
+        self.original = [list(column) for column in self.columns]
+        self.dirty = set()
+        self.endResetModel()
+
+    def clear(self):
+        self.load([])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or not self.columns:
+            return 0
+        return len(self.columns[0])
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.EditRole):
+            return self.columns[index.column()][index.row()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return section + 1
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        row, col = index.row(), index.column()
+        try:
+            self.types[col](value)
+        except ValueError:
+            # Views and delegates see the edit fail
+            return False
+        self.edit([(row, col, self.columns[col][row], value)], merge=True)
+        return True
+
+    def value(self, row, col):
+        return self.columns[col][row]
+
+    def is_dirty(self):
+        return bool(self.dirty)
+
+    def dirty_cells(self):
+        return sorted(self.dirty)
+
+    def mark_clean(self, values=None):
+        # The given (row, col, value) cells, or every dirty cell, become the
+        # new baseline, e.g. after a save. Cells edited again since the values
+        # were taken stay dirty.
+        if values is None:
+            values = [(row, col, self.columns[col][row]) for row, col in self.dirty]
+        for row, col, value in values:
+            self.original[col][row] = value
+            if self.columns[col][row] == value:
+                self.dirty.discard((row, col))
+            else:
+                self.dirty.add((row, col))
+
+    def edit_rows(self, rows):
+        # rows yields (row, [(col, value), ...]); the cells that differ are
+        # collected in one pass and applied as one undoable edit.
+        row_count = self.rowCount()
+        changes = []
+        for row, values in rows:
+            if not 0 <= row < row_count:
+                continue
+            for col, value in values:
+                old_value = self.columns[col][row]
+                if value != old_value:
+                    changes.append((row, col, old_value, value))
+        self.edit(changes)
+        return len(changes)
+
+    def edit(self, changes, merge=False):
+        # User edits go through the undo stack, one command per operation.
+        # merge lets consecutive typing in one cell collapse into one command.
+        converted = []
+        for row, col, old_value, new_value in changes:
+            try:
+                new_value = self.types[col](new_value)
+            except ValueError:
+                continue
+            if new_value != old_value:
+                converted.append((row, col, old_value, new_value))
+        changes = converted
+        if not changes:
+            return
+        if self.undo_stack is None:
+            self.set_values([(row, col, new_value) for row, col, _, new_value in changes])
+        else:
+            self.undo_stack.push(MultiEditCommand(self, changes, merge))
+
+    def set_values(self, values):
+        if not values:
+            return
+        # One dataChanged covers the whole batch
+        for row, col, value in values:
+            self.columns[col][row] = value
+            if value == self.original[col][row]:
+                self.dirty.discard((row, col))
+            else:
+                self.dirty.add((row, col))
+        rows = [row for row, _, _ in values]
+        cols = [col for _, col, _ in values]
+        self.dataChanged.emit(self.index(min(rows), min(cols)), self.index(max(rows), max(cols)))
+
+class SearchFilterProxyModel(QSortFilterProxyModel):
+    # Shows only the source rows that have a cell matching the query in a
+    # SearchIndex keyed by (table, row, column).
+    def __init__(self, table, parent=None):
+        super().__init__(parent)
+        self.table = table
+        self.search_index = None
+        self.query = ""
+        self.rows = None
+
+    def set_search(self, search_index, query):
+        self.search_index = search_index
+        self.query = query
+        self.refresh()
+
+    def refresh(self):
+        if self.search_index is None or not self.query:
+            rows = None
+        else:
+            rows = {key[1] for key in self.search_index.search(self.query) if key[0] == self.table}
+        if rows != self.rows:
+            self.rows = rows
+            self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self.rows is None or source_row in self.rows
+
+class CustomTableView(QTableView):
     def __init__(self, *args, **kwargs):
-        super(CustomTableWidget, self).__init__(*args, **kwargs)
+        super(CustomTableView, self).__init__(*args, **kwargs)
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.context_menu)
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.clipboard_data = []
 
     def context_menu(self, pos):
@@ -53,80 +212,128 @@ class CustomTableWidget(QTableWidget):
             self.showAllColumns()
 
     def undo(self):
-        self.parent().undo_stack.undo()
+        self.window().undo_stack.undo()
 
     def redo(self):
-        self.parent().undo_stack.redo()
+        self.window().undo_stack.redo()
+
+    def source_model(self):
+        model = self.model()
+        return model.sourceModel() if hasattr(model, "sourceModel") else model
+
+    def source_cell(self, index):
+        # View rows follow the sort order; edits address the unsorted model.
+        model = self.model()
+        if hasattr(model, "mapToSource"):
+            index = model.mapToSource(index)
+        return index.row(), index.column()
+
+    def selected_indexes(self):
+        return sorted(self.selectedIndexes(), key=lambda index: (index.row(), index.column()))
 
     def cut(self):
         self.copy()
         self.delete()
 
     def copy(self):
-        self.clipboard_data.clear()
-        for cell_range in self.selectedRanges():
-            for row in range(cell_range.topRow(), cell_range.bottomRow() + 1):
-                for col in range(cell_range.leftColumn(), cell_range.rightColumn() + 1):
-                    item = self.item(row, col)
-                    if item:
-                        self.clipboard_data.append(((row, col), item.text()))
+        self.clipboard_data = [((index.row(), index.column()), index.data()) for index in self.selected_indexes()]
 
     def paste(self):
         if self.clipboard_data:
-            row_offset = self.currentRow() - self.clipboard_data[0][0][0]
-            col_offset = self.currentColumn() - self.clipboard_data[0][0][1]
+            model = self.model()
+            source = self.source_model()
+            current = self.currentIndex()
+            row_offset = current.row() - self.clipboard_data[0][0][0]
+            col_offset = current.column() - self.clipboard_data[0][0][1]
+            changes = []
             for (row, col), text in self.clipboard_data:
                 new_row = row + row_offset
                 new_col = col + col_offset
-                if 0 <= new_row < self.rowCount() and 0 <= new_col < self.columnCount():
-                    existing_item = self.item(new_row, new_col)
-                    if existing_item is None:
-                        existing_item = QTableWidgetItem("")
-                        existing_item.setData(Qt.UserRole, "")
-                        self.setItem(new_row, new_col, existing_item)
-                    elif existing_item.data(Qt.UserRole) is None:
-                        existing_item.setData(Qt.UserRole, existing_item.text())
-                    existing_item.setText(text)
+                if 0 <= new_row < model.rowCount() and 0 <= new_col < model.columnCount():
+                    source_row, source_col = self.source_cell(model.index(new_row, new_col))
+                    changes.append((source_row, source_col, source.value(source_row, source_col), text))
+            source.edit(changes)
 
     def delete(self):
-        for cell_range in self.selectedRanges():
-            for row in range(cell_range.topRow(), cell_range.bottomRow() + 1):
-                for col in range(cell_range.leftColumn(), cell_range.rightColumn() + 1):
-                    existing_item = self.item(row, col)
-                    if existing_item is None:
-                        existing_item = QTableWidgetItem("")
-                        existing_item.setData(Qt.UserRole, "")
-                        self.setItem(row, col, existing_item)
-                    elif existing_item.data(Qt.UserRole) is None:
-                        existing_item.setData(Qt.UserRole, existing_item.text())
-                    existing_item.setText("")
+        source = self.source_model()
+        changes = []
+        for index in self.selected_indexes():
+            row, col = self.source_cell(index)
+            changes.append((row, col, source.value(row, col), ""))
+        source.edit(changes)
 
     def hideColumns(self):
-        selected_columns = set()
-        for cell_range in self.selectedRanges():
-            for col in range(cell_range.leftColumn(), cell_range.rightColumn() + 1):
-                selected_columns.add(col)
+        selected_columns = set(index.column() for index in self.selectedIndexes())
         for col in selected_columns:
             self.setColumnHidden(col, True)
 
     def showAllColumns(self):
-        for col in range(self.columnCount()):
+        for col in range(self.model().columnCount()):
             self.setColumnHidden(col, False)
 
+class RosterWorker(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, task, *args):
+        super().__init__()
+        self.task = task
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        # Called from the GUI thread; the task sees it at its next report.
+        self.cancelled = True
+
+    def report(self, done, total):
+        self.progress.emit(done, total)
+        return not self.cancelled
+
+    def run(self):
+        # Anything the task raises must still end the worker, or the editor waits on it forever
+        try:
+            result = self.task(self.report, *self.args)
+        except Exception as e:
+            self.failed.emit(str(e) or type(e).__name__)
+            return
+        self.finished.emit(result)
+
 class MultiEditCommand(QUndoCommand):
-    def __init__(self, table, changes):
+    TYPING_ID = 1
+
+    def __init__(self, model, changes, merge=False):
         super().__init__()
-        self.table = table
-        self.changes = changes
+        self.model = model
+        self.merge = merge
+        # Cells are kept in two int arrays, and a bulk edit that writes one
+        # value everywhere (delete, cut) keeps that value once.
+        self.rows = array("l", [row for row, _, _, _ in changes])
+        self.cols = array("l", [col for _, col, _, _ in changes])
+        self.old_values = tuple(old_value for _, _, old_value, _ in changes)
+        new_values = tuple(new_value for _, _, _, new_value in changes)
+        self.new_values = new_values if len(set(new_values)) > 1 else new_values[0]
+
+    def id(self):
+        return self.TYPING_ID if self.merge else -1
+
+    def mergeWith(self, other):
+        # Both tables share one undo stack, so the cell must be in the same model
+        if (other.model is not self.model or len(self.rows) != 1
+                or self.rows != other.rows or self.cols != other.cols):
+            return False
+        self.new_values = other.new_values
+        # Typing a cell back to where it started leaves nothing to undo.
+        self.setObsolete(self.new_values == self.old_values[0])
+        return True
+
+    def _values(self, values):
+        if not isinstance(values, tuple):
+            values = [values] * len(self.rows)
+        return list(zip(self.rows, self.cols, values))
 
     def undo(self):
-        for row, col, old_value, _ in self.changes:
-            item = QTableWidgetItem(old_value)
-            item.setData(Qt.UserRole, old_value)
-            self.table.setItem(row, col, item)
+        self.model.set_values(self._values(self.old_values))
 
     def redo(self):
-        for row, col, _, new_value in self.changes:
-            item = QTableWidgetItem(new_value)
-            item.setData(Qt.UserRole, new_value)
-            self.table.setItem(row, col, item)
+        self.model.set_values(self._values(self.new_values))